@@ -1,7 +1,12 @@
+import hashlib
+import json
+import os
+import re
+import time
 from enum import Enum
-from typing import AsyncIterator, Callable
+from typing import AsyncIterator, Callable, Optional
 from dotenv import load_dotenv
-from agents import Agent, Runner, TResponseInputItem, function_tool, AgentHooks, ItemHelpers
+from agents import Agent, Runner, RunResultStreaming, TResponseInputItem, function_tool, AgentHooks, ItemHelpers
 from agents.voice import (
     SingleAgentVoiceWorkflow,
     SingleAgentWorkflowCallbacks,
@@ -12,6 +17,12 @@ from langchain_openai import ChatOpenAI
 from browser_use import Agent as BrowserAgent, Browser, BrowserConfig
 from pydantic import BaseModel, Field
 from mcp_client import MCPClient
+from browser_pool import BrowserContextPool
+from cache import PersistentTTLCache, TTLCache, normalize_text
+from history import ConversationHistory
+from segmenter import SentenceSegmenter
+from intent_router import IntentRouter, register_default_intents
+from plan_executor import PlanExecutor
 from dataclasses import dataclass
 
 load_dotenv()
@@ -23,6 +34,36 @@ browser = Browser(
     # )
 )
 
+# Warm browser contexts shared by concurrent searches
+browser_pool = BrowserContextPool(
+    browser,
+    size=int(os.getenv("BROWSER_POOL_SIZE", "2")),
+    max_uses=int(os.getenv("BROWSER_CONTEXT_MAX_USES", "20")),
+)
+
+
+async def close_browser():
+    """Close the pooled browser contexts, then the browser. Call once on shutdown."""
+    await browser_pool.close()
+    await browser.close()
+
+# Words dropped from queries before they are used as search cache keys.
+# Question words and tensed verbs stay, so "who is X" and "what is X", or
+# "who is X" and "who was X", don't share an answer.
+SEARCH_STOPWORDS = {
+    "a", "an", "the", "be", "of", "for", "to", "in", "on", "at", "by", "and",
+    "or", "me", "tell", "please", "can", "could", "would", "you", "i", "do",
+    "does", "about", "search", "find", "look", "up", "web",
+}
+
+# Recent search answers, kept in memory with a SQLite spillover
+search_cache = PersistentTTLCache(
+    os.getenv("SEARCH_CACHE_PATH", ".search_cache.sqlite3"),
+    max_size=int(os.getenv("SEARCH_CACHE_MEMORY_SIZE", "256")),
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", "900")),
+    max_disk_size=int(os.getenv("SEARCH_CACHE_DISK_SIZE", "10000")),
+)
+
 @function_tool
 async def search_web(query: str) -> str:
     """
@@ -34,15 +75,27 @@ async def search_web(query: str) -> str:
     returns:
         str: The answer to the query
     """
-    agent = BrowserAgent(
-            task=query,
-            llm=ChatOpenAI(model="gpt-4o-mini"),
-            use_vision=True, 
-            browser=browser
-        )
-    
-    result = await agent.run()
-    return result
+    cache_key = normalize_text(query, SEARCH_STOPWORDS) or query
+    cached = await search_cache.aget(cache_key)
+    if cached is not None:
+        return cached
+
+    async with browser_pool.acquire() as context:
+        agent = BrowserAgent(
+                task=query,
+                llm=ChatOpenAI(model="gpt-4o-mini"),
+                use_vision=True, 
+                browser=browser,
+                browser_context=context
+            )
+        
+        result = await agent.run()
+
+    answer = result.final_result()
+    if not answer:
+        return str(result)
+    await search_cache.aset(cache_key, answer)
+    return answer
 
 developer = Agent(
     name="Developer",
@@ -76,6 +129,11 @@ researcher = Agent(
 class Task(BaseModel):
     agent: str = Field(description="Agent name")
     task: str = Field(description="Task description")
+    id: Optional[str] = Field(default=None, description="Short unique task id, e.g. task1")
+    depends_on: Optional[list[str]] = Field(
+        default=None,
+        description="Ids of tasks whose results this task needs, or null to infer them",
+    )
     
 
 class Plan(BaseModel):
@@ -92,6 +150,24 @@ manager = Agent(
     model="gpt-4o"
 )
 
+# Runs the manager's plans with independent tasks in parallel
+plan_executor = PlanExecutor(
+    {"developer": developer, "tester": tester, "researcher": researcher},
+    max_concurrency=int(os.getenv("PLAN_MAX_CONCURRENCY", "4")),
+)
+
+planner = manager.clone(
+    instructions="""
+    You are a manager who coordinates tasks between agents.
+    Create a plan for the agents to complete the task.
+    Assign each task to one of the agents: researcher, developer, tester.
+    Give each task an id and list the ids of the tasks whose results it needs in depends_on.
+    Tasks that do not depend on each other will run at the same time.
+    """,
+    handoffs=[],
+    output_type=Plan,
+)
+
 agent = Agent(
         name="Assistant",
         instructions=f"""
@@ -124,48 +200,198 @@ class VoiceStreamEventText:
     type: str = "voice_stream_event_text"
     text: str = ""
 
+# Questions whose answers go stale, so they are never answered from the response cache
+TIME_SENSITIVE = re.compile(
+    r"\b(?:now|today|tonight|tomorrow|yesterday|current(?:ly)?|latest|recent(?:ly)?|news"
+    r"|weather|time|date|price|stocks?|scores?|this (?:week|month|year))\b"
+)
+
+
+# Questions that lean on earlier turns or on who is asking, whose answers can't be
+# reused in another context. Matched against normalize_text() output, so "I'm" is "im"
+CONTEXT_DEPENDENT = re.compile(
+    r"\b(?:he|she|it|they|him|her|them|his|hers|its|their|theirs|that|this|those|these"
+    r"|there|again|else|more|previous|above|last one"
+    r"|i|im|ive|id|me|my|mine|myself|we|us|our|ours|ourselves|weve"
+    r"|just|earlier|before|ago|said|asked|told)\b"
+)
+
+# Spoken answers to repeated questions. Keys include the conversation so far, so
+# conversations only share answers given in the same context, e.g. as a first question
+response_cache = TTLCache(
+    max_size=int(os.getenv("RESPONSE_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "600")),
+)
+
+
+def agent_fingerprint(agent: Agent) -> str:
+    """Hash the parts of an agent's configuration that shape its answers."""
+    parts = [
+        agent.name,
+        str(agent.instructions),
+        str(agent.model),
+        ",".join(sorted(tool.name for tool in agent.tools)),
+        ",".join(sorted(handoff.name if isinstance(handoff, Agent) else handoff.agent_name
+                        for handoff in agent.handoffs)),
+    ]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()[:16]
+
+
+def context_fingerprint(items: list[TResponseInputItem]) -> str:
+    """Hash the conversation context, e.g. a history's summary and recent turns."""
+    return hashlib.sha256(json.dumps(items, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
 class MyWorkflow(VoiceWorkflowBase):
-    def __init__(self, secret_word: str, on_start: Callable[[str], None]):
+    def __init__(
+        self,
+        secret_word: str,
+        on_start: Callable[[str], None],
+        response_cache: Optional[TTLCache] = None,
+    ):
         """
         Args:
             secret_word: The secret word to guess.
             on_start: A callback that is called when the workflow starts. The transcription
                 is passed in as an argument.
+            response_cache: Cache of spoken answers to repeated questions, e.g. the shared
+                response_cache. Answers that used tools or handed off, and time-sensitive
+                or context-dependent questions, are never cached.
         """
-        self._input_history: list[TResponseInputItem] = []
+        self._history = ConversationHistory(
+            max_tokens=int(os.getenv("HISTORY_MAX_TOKENS", "4000")),
+            keep_turns=int(os.getenv("HISTORY_KEEP_TURNS", "4")),
+        )
         self._current_agent = agent
-        self._secret_word = secret_word.lower()
         self._on_start = on_start
+        # Intents answered locally, without calling the model
+        self.router = IntentRouter()
+        self.router.register(
+            "secret_word",
+            [f".*{re.escape(normalize_text(secret_word))}.*"],
+            lambda _: "You guessed the secret word!",
+        )
+        register_default_intents(self.router)
+        self._response_cache = response_cache
+        self._active_run: Optional[RunResultStreaming] = None
+        self._interrupted = False
+        # Seconds from transcription to the first speakable segment, per turn
+        self.first_segment_latencies: list[float] = []
+
+    def interrupt(self) -> bool:
+        """Cancel the agent run for the current turn, if one is in flight."""
+        if self._active_run is None or self._active_run.is_complete:
+            return False
+        self._active_run.cancel()
+        self._interrupted = True
+        return True
+
+    def _record_first_segment(self, started: float):
+        latency = time.perf_counter() - started
+        self.first_segment_latencies.append(latency)
+        print(f"[debug] time to first segment: {latency * 1000:.0f}ms")
+
+    async def _segments(self, result: RunResultStreaming) -> AsyncIterator[str]:
+        segmenter = SentenceSegmenter()
+        async for chunk in VoiceWorkflowHelper.stream_text_from(result):
+            for segment in segmenter.feed(chunk):
+                yield segment
+        for segment in segmenter.flush():
+            yield segment
+
+    def _cache_key(self, transcription: str) -> Optional[tuple[str, str, str]]:
+        """Key a transcription by its text, the agent's configuration and the conversation.
+
+        The conversation is the summary and recent turns the agent would see,
+        so an answer is only replayed into the same context, e.g. the same
+        opening question in another session. Questions about the user or
+        that refer back to earlier turns are not cached at all.
+        """
+        text = normalize_text(transcription)
+        if (
+            self._response_cache is None
+            or not text
+            or TIME_SENSITIVE.search(text)
+            or CONTEXT_DEPENDENT.search(text)
+        ):
+            return None
+        context = context_fingerprint(self._history.items())
+        return text, agent_fingerprint(self._current_agent), context
 
     async def run(self, transcription: str) -> AsyncIterator[VoiceStreamEventText]:
+        started = time.perf_counter()
         self._on_start(transcription)
 
-        # Add the transcription to the input history
-        self._input_history.append(
-            {
-                "role": "user",
-                "content": transcription,
-            }
-        )
+        user_message: TResponseInputItem = {
+            "role": "user",
+            "content": transcription,
+        }
+
+        # If the transcription is a canned intent, answer it without the model
+        match = self.router.route(transcription)
+        if match is not None:
+            print(f"[debug] intent {match.intent} answered locally")
+            yield VoiceStreamEventText(text=match.response)
+            self._history.add_turn(
+                [
+                    user_message,
+                    {
+                        "role": "assistant",
+                        "content": match.response,
+                    },
+                ]
+            )
+            return
 
-        # If the user guessed the secret word, do alternate logic
-        if self._secret_word in transcription.lower():
-            yield VoiceStreamEventText(text="You guessed the secret word!")
-            self._input_history.append(
-                {
-                    "role": "assistant",
-                    "content": "You guessed the secret word!",
-                }
+        # Replay the answer to a repeated question
+        cache_key = self._cache_key(transcription)
+        cached = self._response_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            self._record_first_segment(started)
+            for segment in cached:
+                yield VoiceStreamEventText(text=segment)
+            self._history.add_turn(
+                [
+                    user_message,
+                    {
+                        "role": "assistant",
+                        "content": " ".join(cached),
+                    },
+                ]
             )
             return
 
-        # Otherwise, run the agent
-        result = Runner.run_streamed(self._current_agent, self._input_history)
+        # Otherwise, run the agent on the summary plus the most recent turns
+        input_items = self._history.items(user_message)
+        result = Runner.run_streamed(self._current_agent, input_items)
+        self._active_run = result
+        self._interrupted = False
 
-        async for chunk in VoiceWorkflowHelper.stream_text_from(result):
-            yield VoiceStreamEventText(text=chunk)
+        # Emit whole sentences and clauses as they close so TTS can start early
+        segments = []
+        try:
+            async for segment in self._segments(result):
+                if started is not None:
+                    self._record_first_segment(started)
+                    started = None
+                segments.append(segment)
+                yield VoiceStreamEventText(text=segment)
+        finally:
+            self._active_run = None
 
-        # Update the input history and current agent
-        self._input_history = result.to_input_list()
-        self._current_agent = result.last_agent
+        used_tools = any(
+            item.type in ("tool_call_item", "handoff_call_item") for item in result.new_items
+        )
+        # Never cache an answer the user cut short
+        if (
+            cache_key
+            and segments
+            and not used_tools
+            and not self._interrupted
+            and result.last_agent is self._current_agent
+        ):
+            self._response_cache.set(cache_key, segments)
 
+        # Record this turn and update the current agent
+        self._history.add_turn([user_message] + result.to_input_list()[len(input_items):])
+        self._current_agent = result.last_agent
@@ -1,4 +1,4 @@
-from agent import agent, developer, VoiceMode, WorkflowCallbacks
+from agent import agent, close_browser, developer, VoiceMode, WorkflowCallbacks
 
 from agents.voice import (
     SingleAgentVoiceWorkflow,
@@ -20,7 +20,7 @@ async def main():
     
     
     try:
-        await client.connect_to_server("mcp_server.py")
+        await client.connect_to_servers("servers_config.json")
         
         if voice_mode == VoiceMode.ON_NO_STREAMING:
             pipeline = VoicePipeline(
@@ -58,6 +58,7 @@ async def main():
             await client.chat_loop()
     finally:
         await client.cleanup()
+        await close_browser()
    
 if __name__ == "__main__":
     asyncio.run(main())
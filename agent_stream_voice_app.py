@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import asyncio
+import os
 
 import numpy as np
 import sounddevice as sd
@@ -14,7 +15,8 @@ from typing_extensions import override
 from agents.voice import StreamedAudioInput, VoicePipeline
 from dotenv import load_dotenv
 
-from agent import MyWorkflow
+from agent import MyWorkflow, close_browser, response_cache
+from vad import VoiceActivityDetector
 
 load_dotenv()
 
@@ -22,6 +24,12 @@ CHUNK_LENGTH_S = 0.05  # 100ms
 SAMPLE_RATE = 24000
 FORMAT = np.int16
 CHANNELS = 1
+# Barge-in: mic level (dBFS) and duration that count as the user talking over the assistant.
+# Off by default: without a headset or echo cancellation the mic picks up the
+# assistant's own playback, which would interrupt it.
+BARGE_IN = os.getenv("BARGE_IN", "0").lower() in ("1", "true", "yes")
+BARGE_IN_THRESHOLD = 32768 * 10 ** (-35 / 20)
+BARGE_IN_MS = 200
 
 
 class Header(Static):
@@ -117,10 +125,19 @@ class RealtimeApp(App[None]):
         self.last_audio_item_id = None
         self.should_send_audio = asyncio.Event()
         self.connected = asyncio.Event()
-        self.pipeline = VoicePipeline(
-            workflow=MyWorkflow(secret_word="dog", on_start=self._on_transcription)
+        self.assistant_speaking = False
+        # Audio from an interrupted turn is dropped until the next turn starts
+        self.muted = False
+        self._speech_ms = 0
+        self.workflow = MyWorkflow(
+            secret_word="dog",
+            on_start=self._on_transcription,
+            response_cache=response_cache,
         )
+        self.pipeline = VoicePipeline(workflow=self.workflow)
         self._audio_input = StreamedAudioInput()
+        # Only speech, with some padding, is sent to speech-to-text
+        self.vad = VoiceActivityDetector(sample_rate=SAMPLE_RATE)
         self.audio_player = sd.OutputStream(
             samplerate=SAMPLE_RATE,
             channels=CHANNELS,
@@ -145,6 +162,9 @@ class RealtimeApp(App[None]):
         self.run_worker(self.start_voice_pipeline())
         self.run_worker(self.send_mic_audio())
 
+    async def on_unmount(self) -> None:
+        await close_browser()
+
     async def start_voice_pipeline(self) -> None:
         try:
             self.audio_player.start()
@@ -153,12 +173,19 @@ class RealtimeApp(App[None]):
             async for event in self.result.stream():
                 bottom_pane = self.query_one("#bottom-pane", RichLog)
                 if event.type == "voice_stream_event_audio":
+                    if self.muted:
+                        continue
                     self.audio_player.write(event.data)
                     bottom_pane.write(
                         f"Received audio: {len(event.data) if event.data is not None else '0'} bytes"
                     )
                 elif event.type == "voice_stream_event_lifecycle":
                     bottom_pane.write(f"Lifecycle event: {event.event}")
+                    if event.event == "turn_started":
+                        self.assistant_speaking = True
+                        self.muted = False
+                    elif event.event == "turn_ended":
+                        self.assistant_speaking = False
         except Exception as e:
             bottom_pane = self.query_one("#bottom-pane", RichLog)
             bottom_pane.write(f"Error: {e}")
@@ -190,14 +217,31 @@ class RealtimeApp(App[None]):
                 status_indicator.is_recording = True
 
                 data, _ = stream.read(read_size)
+                if BARGE_IN:
+                    self._detect_barge_in(data)
 
-                await self._audio_input.add_audio(data)
+                speech = self.vad.process(data)
+                if len(speech):
+                    await self._audio_input.add_audio(speech)
                 await asyncio.sleep(0)
         except KeyboardInterrupt:
             pass
         finally:
             stream.stop()
             stream.close()
+            print(f"[debug] VAD dropped {self.vad.dropped_fraction:.0%} of mic audio as silence")
+
+    def _detect_barge_in(self, data: np.ndarray) -> None:
+        """Interrupt the assistant when the user keeps talking over it."""
+        rms = np.sqrt(np.mean(np.square(data, dtype=np.float64)))
+        self._speech_ms = self._speech_ms + len(data) * 1000 / SAMPLE_RATE if rms >= BARGE_IN_THRESHOLD else 0
+        if self.assistant_speaking and not self.muted and self._speech_ms >= BARGE_IN_MS:
+            self.muted = True
+            self.workflow.interrupt()
+            # Discard audio already handed to the sound device
+            self.audio_player.abort()
+            self.audio_player.start()
+            self.query_one("#bottom-pane", RichLog).write("Interrupted by user")
 
     async def on_key(self, event: events.Key) -> None:
         """Handle key press events."""
@@ -1,17 +1,24 @@
-import asyncio
+import os
+import sys
 import numpy as np
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import JSONResponse
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 
 # Import the Agents SDK voice packages.
 # (Make sure you have installed openai[voice] and the required Agents SDK dependencies.)
-from agents.voice import VoicePipeline, StreamedAudioInput, SingleAgentVoiceWorkflow
+from agents.voice import VoicePipeline
 from agents import Agent
 from agents.voice import OpenAIVoiceModelProvider, VoicePipelineConfig, STTModelSettings, TTSModelSettings
 
+# Modules shared with the command-line apps live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sessions import SessionManager
+from barge_in import InterruptibleAgentWorkflow
+
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -54,52 +61,59 @@ Pronunciation: Clear, everyday speech; natural emphasis on important points
 Pauses: Short, natural breaks for reflection
 Phrasing: Informal, relatable, familiar"""
 
-# Create a voice pipeline using a single-agent workflow.
-pipeline = VoicePipeline(
-    workflow=SingleAgentVoiceWorkflow(agent),
-    config=VoicePipelineConfig(
-        model_provider=OpenAIVoiceModelProvider(),
-        stt_settings=STTModelSettings(language="en", turn_detection={"type": "semantic_vad", "eagerness": "medium"}),
-        tts_settings=TTSModelSettings(voice="sage", buffer_size=32, dtype=np.int16, instructions=voice_instructions, speed=1.0)
+def create_pipeline() -> VoicePipeline:
+    """Create a voice pipeline, with its own interruptible single-agent workflow, for one connection."""
+    return VoicePipeline(
+        workflow=InterruptibleAgentWorkflow(agent),
+        config=VoicePipelineConfig(
+            model_provider=OpenAIVoiceModelProvider(),
+            stt_settings=STTModelSettings(language="en", turn_detection={"type": "semantic_vad", "eagerness": "medium"}),
+            tts_settings=TTSModelSettings(voice="sage", buffer_size=32, dtype=np.int16, instructions=voice_instructions, speed=1.0)
+        )
     )
+
+sessions = SessionManager(
+    create_pipeline,
+    max_sessions=int(os.getenv("MAX_SESSIONS", "200")),
+    idle_timeout=float(os.getenv("SESSION_IDLE_TIMEOUT", "300")),
+    chunk_ms=int(os.getenv("AUDIO_CHUNK_MS", "40")),
+    buffer_ms=int(os.getenv("AUDIO_BUFFER_MS", "2000")),
+    send_queue_ms=int(os.getenv("AUDIO_SEND_QUEUE_MS", "60000")),
+    send_lag_ms=int(os.getenv("AUDIO_SEND_LAG_MS", "2000")),
+    slow_client_policy=os.getenv("SLOW_CLIENT_POLICY", "drop_oldest"),
+    drop_silence=os.getenv("DROP_SILENCE", "1") == "1",
 )
 
+@app.get("/sessions")
+async def get_sessions():
+    return sessions.stats()
+
+@app.get("/ready")
+async def get_ready():
+    # Load balancers stop routing here while the worker is full or draining
+    status = {"ready": sessions.ready, "active": len(sessions.sessions), "max_sessions": sessions.max_sessions}
+    return JSONResponse(status, status_code=200 if sessions.ready else 503)
+
+@app.on_event("shutdown")
+async def close_sessions():
+    await sessions.shutdown()
+
 @app.websocket("/ws")
 async def audio_endpoint(websocket: WebSocket):
-    await websocket.accept()
-    print("WebSocket connection accepted")
-    # Create a streamed audio input container.
-    audio_input = StreamedAudioInput()
-    # Run the voice pipeline in multi-turn (streaming) mode.
-    result = await pipeline.run(audio_input)
-    
-    async def send_audio():
-        try:
-            # Iterate over streaming events from the pipeline.
-            async for event in result.stream():
-                # Check for audio events from the TTS part.
-                if event.type == "voice_stream_event_audio":
-                    audio_chunk: np.ndarray = event.data  # Expected to be an int16 numpy array.
-                    await websocket.send_bytes(audio_chunk.tobytes())
-                # If the pipeline signals end-of-session, break out.
-                elif event.type == "voice_stream_event_lifecycle" and event.event == "session_ended":
-                    break
-        except Exception as e:
-            print("Error sending audio:", e)
-    
-    send_task = asyncio.create_task(send_audio())
-    
+    # Each connection gets its own pipeline and workflow
+    session = await sessions.open(websocket)
+    if session is None:
+        print("WebSocket connection refused: too many sessions")
+        return
+    print(f"WebSocket connection accepted (session {session.id})")
     try:
-        # Continuously receive PCM audio chunks from the client.
-        async for message in websocket.iter_bytes():
-            # Convert the incoming bytes to a NumPy array (16-bit PCM).
-            audio_chunk = np.frombuffer(message, dtype=np.int16)
-            await audio_input.add_audio(audio_chunk)
+        await session.serve()
     except WebSocketDisconnect:
         print("Client disconnected.")
     finally:
-        send_task.cancel()
+        await sessions.close(session.id)
 
 if __name__ == "__main__":
-    # Run the server with: uvicorn server:app --reload
+    # Development server with auto-reload. In production run backend/serve.py,
+    # which starts one worker per core and drains sessions on SIGTERM.
     uvicorn.run("api:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,72 @@
+import numpy as np
+
+
+class AudioRingBuffer:
+    """Fixed-capacity FIFO of audio samples backed by a preallocated array.
+
+    When a write would overflow the buffer, the oldest samples are dropped
+    so the audio that is kept stays as recent as possible. Dropped samples
+    are counted.
+    """
+
+    def __init__(self, capacity: int, dtype=np.int16):
+        """
+        Args:
+            capacity: Maximum number of samples held
+            dtype: Sample type
+        """
+        self.capacity = capacity
+        self._buffer = np.zeros(capacity, dtype=dtype)
+        self._start = 0
+        self._size = 0
+        self.frames_in = 0
+        self.samples_in = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def write(self, samples: np.ndarray) -> int:
+        """Append samples, dropping the oldest on overflow.
+
+        Returns:
+            Number of samples dropped by this write
+        """
+        self.frames_in += 1
+        self.samples_in += len(samples)
+        dropped = 0
+        if len(samples) > self.capacity:
+            dropped += len(samples) - self.capacity
+            samples = samples[-self.capacity:]
+        overflow = self._size + len(samples) - self.capacity
+        if overflow > 0:
+            self._start = (self._start + overflow) % self.capacity
+            self._size -= overflow
+            dropped += overflow
+
+        end = (self._start + self._size) % self.capacity
+        first = min(len(samples), self.capacity - end)
+        self._buffer[end:end + first] = samples[:first]
+        self._buffer[:len(samples) - first] = samples[first:]
+        self._size += len(samples)
+        self.dropped += dropped
+        return dropped
+
+    def read(self, count: int) -> np.ndarray:
+        """Remove and return up to count of the oldest samples."""
+        count = min(count, self._size)
+        first = min(count, self.capacity - self._start)
+        out = np.empty(count, dtype=self._buffer.dtype)
+        out[:first] = self._buffer[self._start:self._start + first]
+        out[first:] = self._buffer[:count - first]
+        self._start = (self._start + count) % self.capacity
+        self._size -= count
+        return out
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "buffered": self._size,
+            "frames_in": self.frames_in,
+            "samples_in": self.samples_in,
+            "dropped": self.dropped,
+        }
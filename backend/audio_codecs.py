@@ -0,0 +1,66 @@
+import numpy as np
+
+# G.711 mu-law constants
+MULAW_BIAS = 0x84
+MULAW_CLIP = 32635
+
+
+def _build_mulaw_tables() -> tuple[np.ndarray, np.ndarray]:
+    """Build lookup tables for every int16 sample and every mu-law byte."""
+    samples = np.arange(-32768, 32768, dtype=np.int32)
+    sign = np.where(samples < 0, 0x80, 0x00)
+    magnitude = np.minimum(np.abs(samples), MULAW_CLIP) + MULAW_BIAS
+    # Position of the highest set bit above bit 7 gives the segment
+    exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 7
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    encoded = ~(sign | (exponent << 4) | mantissa) & 0xFF
+    # Index the table with the sample's bit pattern viewed as uint16
+    encode = np.empty(65536, dtype=np.uint8)
+    encode[samples.astype(np.int16).view(np.uint16)] = encoded
+
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    magnitude = (((codes & 0x0F) << 3) + MULAW_BIAS) << exponent
+    decode = np.where(codes & 0x80, MULAW_BIAS - magnitude, magnitude - MULAW_BIAS).astype(np.int16)
+    return encode, decode
+
+
+MULAW_ENCODE, MULAW_DECODE = _build_mulaw_tables()
+
+
+class PCM16Codec:
+    """Raw 16-bit little-endian PCM, 2 bytes per sample."""
+
+    name = "pcm16"
+
+    def encode(self, samples: np.ndarray) -> bytes:
+        return samples.astype("<i2", copy=False).tobytes()
+
+    def decode(self, data: bytes) -> np.ndarray:
+        return np.frombuffer(data, dtype="<i2").astype(np.int16, copy=False)
+
+
+class MuLawCodec:
+    """G.711 mu-law, 1 byte per sample, encoded and decoded by table lookup."""
+
+    name = "mulaw"
+
+    def encode(self, samples: np.ndarray) -> bytes:
+        return MULAW_ENCODE[samples.astype(np.int16, copy=False).view(np.uint16)].tobytes()
+
+    def decode(self, data: bytes) -> np.ndarray:
+        return MULAW_DECODE[np.frombuffer(data, dtype=np.uint8)]
+
+
+# Supported codecs, most compact first
+CODECS = {codec.name: codec for codec in (MuLawCodec(), PCM16Codec())}
+
+DEFAULT_CODEC = CODECS["pcm16"]
+
+
+def negotiate(offered: list[str]):
+    """Pick the most compact codec both sides support, falling back to PCM16."""
+    for name, codec in CODECS.items():
+        if name in offered:
+            return codec
+    return DEFAULT_CODEC
@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Optional, Union
+
+import numpy as np
+from fastapi import WebSocket
+
+from audio_codecs import CODECS
+
+logger = logging.getLogger(__name__)
+
+# What to do when a client cannot keep up with the audio sent to it
+SLOW_CLIENT_POLICIES = ("drop_oldest", "degrade", "disconnect")
+
+# Close code for clients disconnected for being too slow
+POLICY_VIOLATION = 1008
+
+
+class AudioSender:
+    """Sends a session's outbound audio without letting the client slow the pipeline.
+
+    The pipeline hands audio to enqueue(), which never blocks. A separate
+    task drains the queue, coalescing small chunks into frames of up to
+    frame_samples and sending each with the session's codec.
+
+    TTS produces audio faster than realtime, so a long queue on its own
+    says nothing about the client. A client is lagging when its
+    connection can't carry audio in realtime: time spent blocked in
+    send_bytes beyond the duration of the audio sent adds up, and once
+    it exceeds max_send_lag seconds the slow-client policy applies:
+
+    - drop_oldest: drop queued audio older than the last max_send_lag seconds
+    - degrade: switch outbound audio to the most compact codec the client
+      offered, then drop the oldest audio if it still lags
+    - disconnect: close the connection
+
+    Independently of the policy, at most max_queue_samples are held and
+    the oldest audio is dropped past that, to bound memory.
+
+    flush() drops queued audio and mutes the sender until resume(), for
+    when the user interrupts the assistant.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        codec,
+        frame_samples: int = 960,
+        max_queue_samples: int = 1_440_000,
+        max_send_lag: float = 2.0,
+        policy: str = "drop_oldest",
+        offered_codecs: Optional[list[str]] = None,
+        sample_rate: int = 24000,
+    ):
+        """
+        Args:
+            websocket: The client connection
+            codec: Codec used to encode outbound audio
+            frame_samples: Target number of samples per websocket message
+            max_queue_samples: Queued samples above which the oldest are dropped
+            max_send_lag: Seconds the connection may fall behind realtime before
+                the client counts as lagging
+            policy: One of SLOW_CLIENT_POLICIES
+            offered_codecs: Codecs the client accepts, for the degrade policy
+            sample_rate: Sample rate of the audio, to track how long the client will play
+        """
+        if policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown slow client policy {policy!r}, expected one of {SLOW_CLIENT_POLICIES}")
+        self.websocket = websocket
+        self.codec = codec
+        self.frame_samples = frame_samples
+        self.max_queue_samples = max_queue_samples
+        self.max_send_lag = max_send_lag
+        self.policy = policy
+        self.offered_codecs = offered_codecs or []
+        self.sample_rate = sample_rate
+        # (enqueued_at, samples or JSON control message) pairs, oldest first
+        self._queue: deque[tuple[float, Union[np.ndarray, str]]] = deque()
+        self._queued = 0
+        self._ready = asyncio.Event()
+        self.closed = False
+        self.too_slow = False
+        self.muted = False
+        # When the client will have played everything sent so far
+        self.playing_until = 0.0
+        # Seconds spent sending beyond the duration of the audio sent
+        self._behind = 0.0
+        # Start and audio duration of the send in progress, if any
+        self._sending_since: Optional[float] = None
+        self._sending_duration = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.degraded = False
+        self.send_latency_avg = 0.0
+        self.send_latency_max = 0.0
+        self.queue_delay_max = 0.0
+
+    def enqueue(self, samples: np.ndarray):
+        """Queue audio for sending. Never blocks."""
+        if self.closed or not len(samples):
+            return
+        if self.muted:
+            self.flushed += len(samples)
+            return
+        self._queue.append((time.monotonic(), samples))
+        self._queued += len(samples)
+        if self.lag > self.max_send_lag:
+            self._handle_lag()
+        if self._queued > self.max_queue_samples:
+            self.dropped += self._drop_audio(self.max_queue_samples)
+        self._ready.set()
+
+    def send_control(self, message: dict, urgent: bool = False):
+        """Queue a JSON control message, ahead of queued audio if urgent."""
+        if self.closed:
+            return
+        entry = (time.monotonic(), json.dumps(message))
+        if urgent:
+            self._queue.appendleft(entry)
+        else:
+            self._queue.append(entry)
+        self._ready.set()
+
+    def _drop_audio(self, limit: int) -> int:
+        """Drop the oldest queued audio until at most limit samples remain."""
+        dropped = 0
+        controls = []
+        while self._queued > limit:
+            entry = self._queue.popleft()
+            if isinstance(entry[1], str):
+                controls.append(entry)
+                continue
+            self._queued -= len(entry[1])
+            dropped += len(entry[1])
+        self._queue.extendleft(reversed(controls))
+        return dropped
+
+    def flush(self):
+        """Drop queued audio, tell the client to stop playing, and mute until resume()."""
+        self.flushed += self._drop_audio(0)
+        self.muted = True
+        self.playing_until = 0.0
+        self.send_control({"type": "flush"}, urgent=True)
+
+    def resume(self):
+        self.muted = False
+
+    @property
+    def lag(self) -> float:
+        """Seconds the connection has fallen behind realtime, including a send still blocked."""
+        lag = self._behind
+        if self._sending_since is not None:
+            lag += max(0.0, time.monotonic() - self._sending_since - self._sending_duration)
+        return lag
+
+    @property
+    def client_playing(self) -> bool:
+        """Whether the client is probably still playing audio already sent."""
+        return time.monotonic() < self.playing_until
+
+    def _handle_lag(self):
+        if self.policy == "disconnect":
+            logger.warning("Disconnecting client that cannot keep up with audio")
+            self.closed = True
+            self.too_slow = True
+            self._queue.clear()
+            self._queued = 0
+            self._ready.set()
+            # A send stuck on a stalled connection would never return
+            if self._sending_since is not None and self._task is not None:
+                self._task.cancel()
+            return
+        if self.policy == "degrade" and not self.degraded:
+            self.degraded = True
+            compact = next((codec for name, codec in CODECS.items() if name in self.offered_codecs), None)
+            if compact is not None and compact is not self.codec:
+                logger.info(f"Client lagging, switching outbound audio to {compact.name}")
+                self.codec = compact
+                # Tell the client to decode what follows with the new codec
+                self.send_control({"type": "playback_codec", "codec": compact.name}, urgent=True)
+                self._behind = 0.0
+                return
+        self.dropped += self._drop_audio(int(self.max_send_lag * self.sample_rate))
+        # Measure afresh, so audio is dropped at most once per max_send_lag
+        self._behind = 0.0
+
+    def _next_frame(self) -> tuple[float, Union[np.ndarray, str]]:
+        """Pop a control message, or queued chunks up to frame_samples."""
+        enqueued_at, samples = self._queue.popleft()
+        if isinstance(samples, str):
+            return enqueued_at, samples
+        chunks = [samples]
+        size = len(samples)
+        while self._queue:
+            chunk = self._queue[0][1]
+            if isinstance(chunk, str) or size + len(chunk) > self.frame_samples:
+                break
+            self._queue.popleft()
+            chunks.append(chunk)
+            size += len(chunk)
+        self._queued -= size
+        return enqueued_at, chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
+    async def _send(self, enqueued_at: float, frame: Union[np.ndarray, str]):
+        started = time.monotonic()
+        if isinstance(frame, str):
+            await self.websocket.send_text(frame)
+            return
+        data = self.codec.encode(frame)
+        duration = len(frame) / self.sample_rate
+        self._sending_since, self._sending_duration = started, duration
+        try:
+            await self.websocket.send_bytes(data)
+        finally:
+            self._sending_since = None
+        latency = time.monotonic() - started
+        self._behind = max(0.0, self._behind + latency - duration)
+        self.send_latency_avg += 0.1 * (latency - self.send_latency_avg)
+        self.send_latency_max = max(self.send_latency_max, latency)
+        self.queue_delay_max = max(self.queue_delay_max, started - enqueued_at)
+        self.frames_sent += 1
+        self.bytes_sent += len(data)
+        self.playing_until = max(self.playing_until, started) + duration
+
+    async def run(self):
+        """Send queued audio until closed or the connection fails."""
+        self._task = asyncio.current_task()
+        try:
+            while not self.closed:
+                await self._ready.wait()
+                self._ready.clear()
+                while self._queue and not self.closed:
+                    await self._send(*self._next_frame())
+                    if self.lag > self.max_send_lag:
+                        self._handle_lag()
+        except asyncio.CancelledError:
+            if not self.too_slow:
+                raise
+        except Exception as e:
+            logger.warning(f"Error sending audio: {e}")
+            self.closed = True
+        if self.too_slow:
+            try:
+                await self.websocket.close(POLICY_VIOLATION, "Client too slow")
+            except Exception as e:
+                logger.debug(f"Error closing slow client: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "codec_out": self.codec.name,
+            "queued": self._queued,
+            "send_lag_ms": round(self.lag * 1000, 2),
+            "frames_sent": self.frames_sent,
+            "bytes_out": self.bytes_sent,
+            "dropped_out": self.dropped,
+            "flushed_out": self.flushed,
+            "send_latency_avg_ms": round(self.send_latency_avg * 1000, 2),
+            "send_latency_max_ms": round(self.send_latency_max * 1000, 2),
+            "queue_delay_max_ms": round(self.queue_delay_max * 1000, 2),
+        }
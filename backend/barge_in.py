@@ -0,0 +1,85 @@
+import asyncio
+from collections.abc import AsyncIterator
+from typing import Optional
+
+import numpy as np
+
+from agents.voice import SingleAgentVoiceWorkflow
+
+
+class SpeechDetector:
+    """Detects the user speaking from the energy of incoming audio.
+
+    Speech is reported once the signal has stayed above threshold_db for
+    min_speech_ms, so clicks and short noises do not count.
+    """
+
+    def __init__(self, threshold_db: float = -35.0, min_speech_ms: int = 200, sample_rate: int = 24000):
+        """
+        Args:
+            threshold_db: Level in dBFS above which audio counts as speech
+            min_speech_ms: How long the level must stay above the threshold
+            sample_rate: Sample rate of the audio
+        """
+        self.threshold = 32768 * 10 ** (threshold_db / 20)
+        self.min_speech_samples = sample_rate * min_speech_ms // 1000
+        self._speech_samples = 0
+
+    def update(self, samples: np.ndarray) -> bool:
+        """Feed audio and return whether the user is currently speaking."""
+        if not len(samples):
+            return False
+        rms = np.sqrt(np.mean(np.square(samples, dtype=np.float64)))
+        if rms >= self.threshold:
+            self._speech_samples += len(samples)
+        else:
+            self._speech_samples = 0
+        return self._speech_samples >= self.min_speech_samples
+
+    def reset(self):
+        self._speech_samples = 0
+
+
+class InterruptibleAgentWorkflow(SingleAgentVoiceWorkflow):
+    """SingleAgentVoiceWorkflow whose in-flight agent run can be cancelled.
+
+    Each text chunk of the parent's run is awaited as its own task. interrupt()
+    cancels that task while it waits on the agent's event stream, which
+    cancels the agent run. An interrupted turn keeps the user's message in
+    the history but not the partial answer.
+    """
+
+    _step: Optional[asyncio.Future] = None
+    _interrupted = False
+
+    def interrupt(self) -> bool:
+        """Cancel the agent run for the current turn, if one is in flight."""
+        if self._step is None or self._interrupted:
+            return False
+        self._interrupted = True
+        # Deferred so a step that has not started yet gets to its wait first
+        self._step.get_loop().call_soon(self._step.cancel)
+        return True
+
+    async def run(self, transcription: str) -> AsyncIterator[str]:
+        chunks = super().run(transcription)
+        self._interrupted = False
+        try:
+            while True:
+                self._step = asyncio.ensure_future(anext(chunks))
+                if self._interrupted:
+                    self._step.get_loop().call_soon(self._step.cancel)
+                try:
+                    chunk = await self._step
+                except StopAsyncIteration:
+                    return
+                except asyncio.CancelledError:
+                    if self._interrupted:
+                        return
+                    raise
+                # Text already buffered when the user interrupted is not spoken
+                if not self._interrupted:
+                    yield chunk
+        finally:
+            self._step = None
+            await chunks.aclose()
@@ -0,0 +1,262 @@
+"""Production entry point for the voice backend.
+
+Starts several uvicorn worker processes serving api:app so sessions spread
+across every core. On Linux each worker binds its own SO_REUSEPORT socket
+and the kernel balances connections between them; elsewhere the master
+binds one socket and shares it with the workers (pre-fork).
+
+On SIGTERM each worker drains: /ready starts failing and new sessions are
+refused at once, but the listener stays open for a grace period so load
+balancers notice and stop routing here before it closes (closing a
+SO_REUSEPORT listener resets connections still in its accept queue). The
+worker exits once its active voice sessions have finished or the drain
+timeout expires. A second signal shuts down immediately.
+
+A worker that exits is restarted, with a growing delay if it keeps dying
+right after it starts; after MAX_FAILED_STARTS such failures in a row the
+whole server gives up, since the cause (port in use, import error) won't
+go away by itself.
+
+Run from the repository root:
+
+    python backend/serve.py --workers 4 --port 8000
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Optional
+
+import uvicorn
+
+logger = logging.getLogger("serve")
+
+# A worker that exits within this many seconds of starting failed to start
+STARTUP_SECONDS = 10.0
+# Consecutive failed starts of one worker after which the server exits
+MAX_FAILED_STARTS = 5
+# Upper bound on the delay before restarting a worker
+MAX_RESTART_DELAY = 30.0
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn server that lets active voice sessions finish before exiting."""
+
+    def __init__(
+        self,
+        config: uvicorn.Config,
+        sessions,
+        drain_timeout: float = 300.0,
+        drain_grace: float = 10.0,
+    ):
+        """
+        Args:
+            config: uvicorn configuration
+            sessions: The app's SessionManager
+            drain_timeout: Seconds to wait for active sessions before shutting down anyway
+            drain_grace: Seconds between /ready failing and the listener closing
+        """
+        super().__init__(config)
+        self.sessions = sessions
+        self.drain_timeout = drain_timeout
+        self.drain_grace = drain_grace
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._draining = False
+
+    async def startup(self, sockets: Optional[list[socket.socket]] = None) -> None:
+        self._loop = asyncio.get_running_loop()
+        await super().startup(sockets=sockets)
+
+    def handle_exit(self, sig: int, frame) -> None:
+        # A second signal, or one before startup finished, shuts down right away
+        if self._draining or self._loop is None:
+            super().handle_exit(sig, frame)
+            return
+        self._draining = True
+        self._loop.call_soon_threadsafe(lambda: self._loop.create_task(self._drain(sig)))
+
+    async def _drain(self, sig: int):
+        logger.info(
+            f"Draining worker {os.getpid()}: waiting for {len(self.sessions.sessions)} active sessions"
+        )
+        deadline = time.monotonic() + self.drain_timeout
+        # /ready now fails; keep accepting until load balancers have noticed,
+        # as closing the listener resets connections still queued on it
+        self.sessions.draining = True
+        await asyncio.sleep(min(self.drain_grace, self.drain_timeout))
+        # Stop accepting connections; other workers keep serving
+        for server in self.servers:
+            server.close()
+        while self.sessions.sessions and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+        if self.sessions.sessions:
+            logger.warning(f"Drain timeout expired with {len(self.sessions.sessions)} sessions active")
+        super().handle_exit(sig, None)
+
+
+def bind_socket(host: str, port: int, reuse_port: bool) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(
+    sock: Optional[socket.socket],
+    host: str,
+    port: int,
+    drain_timeout: float,
+    drain_grace: float,
+    limit_concurrency: int,
+    log_level: str,
+):
+    """Serve api:app in this process, on the shared socket or a SO_REUSEPORT one."""
+    if sock is None:
+        sock = bind_socket(host, port, reuse_port=True)
+    import api
+
+    config = uvicorn.Config(
+        api.app,
+        log_level=log_level,
+        limit_concurrency=limit_concurrency,
+        timeout_graceful_shutdown=10,
+    )
+    DrainingServer(config, api.sessions, drain_timeout, drain_grace).run(sockets=[sock])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the voice backend with several worker processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--max-sessions",
+        type=int,
+        default=int(os.getenv("MAX_SESSIONS", "200")),
+        help="Maximum concurrent voice sessions per worker",
+    )
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=float(os.getenv("DRAIN_TIMEOUT", "300")),
+        help="Seconds a stopping worker waits for active sessions",
+    )
+    parser.add_argument(
+        "--drain-grace",
+        type=float,
+        default=float(os.getenv("DRAIN_GRACE", "10")),
+        help="Seconds a stopping worker keeps accepting after /ready starts failing",
+    )
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper())
+
+    # Workers read their session cap from the environment when importing api
+    os.environ["MAX_SESSIONS"] = str(args.max_sessions)
+    # HTTP requests on top of the voice sessions; beyond this uvicorn answers 503
+    limit_concurrency = args.max_sessions + 64
+
+    # SO_REUSEPORT only balances connections across processes on Linux
+    reuse_port = sys.platform.startswith("linux") and hasattr(socket, "SO_REUSEPORT")
+    shared = None if reuse_port else bind_socket(args.host, args.port, reuse_port=False)
+    logger.info(
+        f"Starting {args.workers} workers on {args.host}:{args.port} "
+        f"({'SO_REUSEPORT' if reuse_port else 'shared socket'})"
+    )
+
+    ctx = multiprocessing.get_context("spawn")
+    worker_args = (
+        shared,
+        args.host,
+        args.port,
+        args.drain_timeout,
+        args.drain_grace,
+        limit_concurrency,
+        args.log_level,
+    )
+
+    def start_worker() -> multiprocessing.Process:
+        process = ctx.Process(target=run_worker, args=worker_args, daemon=False)
+        process.start()
+        return process
+
+    workers = [start_worker() for _ in range(args.workers)]
+    started = [time.monotonic()] * args.workers
+    failed_starts = [0] * args.workers
+    # When each dead worker is due to be restarted
+    restart_at: list[Optional[float]] = [None] * args.workers
+    stopping = False
+    failed = False
+
+    def stop(sig, frame):
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        logger.info("Stopping workers")
+        # Stop the kernel queueing connections no worker will accept
+        if shared is not None:
+            shared.close()
+        # Ctrl+C already reaches every worker through the process group
+        if sig == signal.SIGTERM:
+            for process in workers:
+                if process.is_alive():
+                    process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping:
+        time.sleep(0.5)
+        for index, process in enumerate(workers):
+            if stopping:
+                break
+            now = time.monotonic()
+            if restart_at[index] is not None:
+                if now >= restart_at[index]:
+                    restart_at[index] = None
+                    workers[index] = start_worker()
+                    started[index] = now
+                continue
+            if process.is_alive():
+                continue
+            if now - started[index] < STARTUP_SECONDS:
+                failed_starts[index] += 1
+            else:
+                failed_starts[index] = 0
+            if failed_starts[index] >= MAX_FAILED_STARTS:
+                logger.error(
+                    f"Worker exited with code {process.exitcode} right after starting "
+                    f"{failed_starts[index]} times in a row, shutting down"
+                )
+                failed = True
+                stop(signal.SIGTERM, None)
+                break
+            delay = min(2.0 ** failed_starts[index], MAX_RESTART_DELAY)
+            logger.warning(
+                f"Worker {process.pid} exited with code {process.exitcode}, restarting in {delay:.0f}s"
+            )
+            restart_at[index] = now + delay
+
+    deadline = time.monotonic() + args.drain_grace + args.drain_timeout + 30
+    for process in workers:
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.warning(f"Worker {process.pid} did not stop in time, killing it")
+            process.kill()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Callable, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
+
+from agents.voice import StreamedAudioInput, StreamedAudioResult, VoicePipeline
+
+import numpy as np
+
+from audio_buffer import AudioRingBuffer
+from barge_in import SpeechDetector
+from audio_sender import AudioSender
+from vad import VoiceActivityDetector
+from audio_codecs import DEFAULT_CODEC, negotiate
+
+logger = logging.getLogger(__name__)
+
+# Close code telling clients the server is full and to retry later
+TRY_AGAIN_LATER = 1013
+
+# Sample rate of the PCM audio exchanged with the pipeline
+SAMPLE_RATE = 24000
+
+
+class VoiceSession:
+    """One websocket connection with its own voice pipeline and workflow."""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        pipeline: VoicePipeline,
+        chunk_samples: int = 960,
+        buffer_samples: int = 48000,
+        send_queue_samples: int = 1_440_000,
+        slow_client_policy: str = "drop_oldest",
+        drop_silence: bool = True,
+        send_lag: float = 2.0,
+    ):
+        """
+        Args:
+            websocket: The client connection
+            pipeline: Pipeline serving this connection only
+            chunk_samples: Inbound audio is passed to the pipeline in chunks of this size,
+                and outbound audio is coalesced into frames of up to this size
+            buffer_samples: Inbound audio held before the oldest samples are dropped
+            send_queue_samples: Outbound audio queued before the oldest is dropped
+            slow_client_policy: What to do with lagging clients, see AudioSender
+            drop_silence: Pass only speech, with some padding, to the pipeline
+            send_lag: Seconds the connection may fall behind realtime before the
+                client counts as lagging
+        """
+        self.id = uuid.uuid4().hex
+        self.websocket = websocket
+        self.pipeline = pipeline
+        self.audio_input = StreamedAudioInput()
+        self.result: Optional[StreamedAudioResult] = None
+        self.created_at = time.monotonic()
+        self.last_activity = self.created_at
+        self.bytes_in = 0
+        self.closed = False
+        self.codec = DEFAULT_CODEC
+        self.chunk_samples = chunk_samples
+        self.inbound = AudioRingBuffer(buffer_samples)
+        self.vad = VoiceActivityDetector(sample_rate=SAMPLE_RATE) if drop_silence else None
+        self.chunks_in = 0
+        self._audio_ready = asyncio.Event()
+        # A partial chunk is forwarded once no audio has arrived for two chunk lengths
+        self.flush_after = 2 * chunk_samples / SAMPLE_RATE
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._flush_due = False
+        self._last_audio_at = 0.0
+        self.sender = AudioSender(
+            websocket,
+            self.codec,
+            frame_samples=chunk_samples,
+            max_queue_samples=send_queue_samples,
+            max_send_lag=send_lag,
+            policy=slow_client_policy,
+            sample_rate=SAMPLE_RATE,
+        )
+        # Barge-in: the user talking over the assistant interrupts it
+        self.detector = SpeechDetector(sample_rate=SAMPLE_RATE)
+        self.turn_active = False
+        self.barge_ins = 0
+        self._tasks: set[asyncio.Task] = set()
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    def add_task(self, task: asyncio.Task) -> asyncio.Task:
+        """Tie a task to the session so it is cancelled when the session closes."""
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def start(self):
+        """Start the pipeline in multi-turn (streaming) mode."""
+        self.result = await self.pipeline.run(self.audio_input)
+        self.add_task(asyncio.create_task(self._forward_audio()))
+        self.add_task(asyncio.create_task(self.sender.run()))
+
+    def push_audio(self, samples: np.ndarray):
+        """Buffer audio from the client; it reaches the pipeline in whole chunks."""
+        speech = self.vad.process(samples) if self.vad is not None else samples
+        if len(speech):
+            self.inbound.write(speech)
+            loop = asyncio.get_running_loop()
+            self._last_audio_at = loop.time()
+            if len(self.inbound) >= self.chunk_samples:
+                self._audio_ready.set()
+            # The timer only runs while audio is buffered, so idle sessions never wake
+            if self._flush_timer is None:
+                self._flush_timer = loop.call_later(self.flush_after, self._flush_partial)
+        speaking = self.detector.update(samples)
+        if speaking and not self.sender.muted and (self.turn_active or self.sender.client_playing):
+            self.interrupt()
+
+    def interrupt(self):
+        """Stop the assistant's current answer because the user started speaking.
+
+        Cancels the workflow's agent run if it supports interrupt(), drops
+        queued audio and tells the client to flush what it has buffered.
+        Audio still produced for the interrupted turn is dropped until the
+        next turn starts.
+        """
+        logger.info(f"Session {self.id}: user started speaking, interrupting")
+        self.barge_ins += 1
+        interrupt = getattr(self.pipeline.workflow, "interrupt", None)
+        if interrupt is not None:
+            interrupt()
+        self.sender.flush()
+
+    def turn_started(self):
+        self.turn_active = True
+        self.sender.resume()
+
+    def turn_ended(self):
+        self.turn_active = False
+
+    def _flush_partial(self):
+        """Timer callback: forward a partial chunk if no audio arrived for flush_after."""
+        self._flush_timer = None
+        if not len(self.inbound) or self.closed:
+            return
+        loop = asyncio.get_running_loop()
+        remaining = self._last_audio_at + self.flush_after - loop.time()
+        if remaining > 0:
+            self._flush_timer = loop.call_later(remaining, self._flush_partial)
+            return
+        self._flush_due = True
+        self._audio_ready.set()
+
+    async def _forward_audio(self):
+        """Move coalesced chunks from the inbound buffer to the pipeline.
+
+        Wakes only when a whole chunk is buffered, or when a partial chunk
+        has waited flush_after with no new audio, so the end of an utterance
+        is not held back.
+        """
+        while True:
+            await self._audio_ready.wait()
+            self._audio_ready.clear()
+            flush, self._flush_due = self._flush_due, False
+            while len(self.inbound) >= self.chunk_samples or (flush and len(self.inbound)):
+                await self.audio_input.add_audio(self.inbound.read(self.chunk_samples))
+                self.chunks_in += 1
+
+    async def negotiate_codec(self) -> Optional[bytes]:
+        """Agree on the audio codec with the client.
+
+        The client opens with {"type": "hello", "codecs": [...]} and the server
+        answers {"type": "codec", "codec": name}. Clients that send audio
+        straight away, or an unreadable hello, get raw PCM16. There is no
+        deadline: legacy clients only send once the user speaks, and silent
+        connections are left to the idle reaper.
+
+        Returns:
+            The first audio message if the client skipped the handshake, else None
+        """
+        message = await self.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        if message.get("bytes") is not None:
+            return message["bytes"]
+        try:
+            hello = json.loads(message.get("text") or "{}")
+        except ValueError:
+            hello = {}
+        offered = hello.get("codecs") if isinstance(hello, dict) else None
+        if not isinstance(offered, list):
+            offered = []
+        offered = [name for name in offered if isinstance(name, str)]
+        self.codec = negotiate(offered)
+        self.sender.codec = self.codec
+        self.sender.offered_codecs = offered
+        await self.websocket.send_text(json.dumps({"type": "codec", "codec": self.codec.name}))
+        return None
+
+    async def _send_events(self):
+        """Queue the pipeline's audio for the client and track turns."""
+        try:
+            async for event in self.result.stream():
+                if event.type == "voice_stream_event_audio":
+                    # Queued, never awaited, so a slow client cannot stall the pipeline
+                    self.sender.enqueue(event.data)
+                    self.touch()
+                elif event.type == "voice_stream_event_lifecycle":
+                    if event.event == "turn_started":
+                        self.turn_started()
+                    elif event.event == "turn_ended":
+                        self.turn_ended()
+                    elif event.event == "session_ended":
+                        break
+        except Exception as e:
+            logger.warning(f"Session {self.id}: error sending audio: {e}")
+
+    def _receive(self, message: bytes):
+        self.touch()
+        self.bytes_in += len(message)
+        self.push_audio(self.codec.decode(message))
+
+    async def serve(self):
+        """Exchange audio with the client until it disconnects.
+
+        Agrees on the codec, then streams the pipeline's audio to the client
+        while buffering the client's audio for the pipeline. Call after
+        start(); the caller still closes the session afterwards.
+
+        Raises:
+            WebSocketDisconnect: If the client leaves during the codec handshake
+        """
+        first_audio = await self.negotiate_codec()
+        self.add_task(asyncio.create_task(self._send_events()))
+        if first_audio is not None:
+            self._receive(first_audio)
+        async for message in self.websocket.iter_bytes():
+            self._receive(message)
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+        # Cancelling the task consuming result.stream() also stops the
+        # pipeline's transcription and TTS tasks, closing the speech-to-text
+        # connection
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.websocket.client_state == WebSocketState.CONNECTED:
+            try:
+                await self.websocket.close(code)
+            except Exception as e:
+                logger.debug(f"Error closing websocket for session {self.id}: {e}")
+        self.result = None
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "id": self.id,
+            "age": round(now - self.created_at, 1),
+            "idle": round(now - self.last_activity, 1),
+            "bytes_in": self.bytes_in,
+            "codec": self.codec.name,
+            "chunks_in": self.chunks_in,
+            "barge_ins": self.barge_ins,
+            **self.inbound.stats(),
+            "silence_dropped": round(self.vad.dropped_fraction, 3) if self.vad is not None else 0.0,
+            **self.sender.stats(),
+        }
+
+
+class SessionManager:
+    """Gives each websocket connection its own pipeline and tracks it.
+
+    Connections beyond max_sessions are refused with close code 1013 so
+    clients can retry, and sessions with no audio in either direction for
+    idle_timeout seconds are closed by a background reaper.
+    """
+
+    def __init__(
+        self,
+        pipeline_factory: Callable[[], VoicePipeline],
+        max_sessions: int = 200,
+        idle_timeout: float = 300.0,
+        chunk_ms: int = 40,
+        buffer_ms: int = 2000,
+        send_queue_ms: int = 60000,
+        slow_client_policy: str = "drop_oldest",
+        drop_silence: bool = True,
+        send_lag_ms: int = 2000,
+    ):
+        """
+        Args:
+            pipeline_factory: Creates a new pipeline, with a new workflow, for each session
+            max_sessions: Maximum number of concurrent sessions
+            idle_timeout: Seconds without audio after which a session is closed
+            chunk_ms: Milliseconds of inbound audio coalesced before it reaches the pipeline
+            buffer_ms: Milliseconds of inbound audio buffered before the oldest is dropped
+            send_queue_ms: Milliseconds of outbound audio queued before the oldest is dropped
+            slow_client_policy: drop_oldest, degrade or disconnect, see AudioSender
+            drop_silence: Drop silence from inbound audio before it reaches speech-to-text
+            send_lag_ms: Milliseconds a connection may fall behind realtime before the
+                client counts as lagging
+        """
+        self.pipeline_factory = pipeline_factory
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.chunk_samples = SAMPLE_RATE * chunk_ms // 1000
+        self.buffer_samples = SAMPLE_RATE * buffer_ms // 1000
+        self.send_queue_samples = SAMPLE_RATE * send_queue_ms // 1000
+        self.send_lag = send_lag_ms / 1000
+        self.slow_client_policy = slow_client_policy
+        self.drop_silence = drop_silence
+        self.sessions: dict[str, VoiceSession] = {}
+        self._reaper: Optional[asyncio.Task] = None
+        # Set while the worker shuts down: no new sessions are accepted
+        self.draining = False
+        self.opened = 0
+        self.rejected = 0
+        self.idle_closed = 0
+
+    async def open(self, websocket: WebSocket) -> Optional[VoiceSession]:
+        """Accept a connection and start its session.
+
+        Returns:
+            The session, or None if the server is full and the connection was refused
+        """
+        await websocket.accept()
+        if self.draining or len(self.sessions) >= self.max_sessions:
+            self.rejected += 1
+            await websocket.close(TRY_AGAIN_LATER, "Server draining" if self.draining else "Too many sessions")
+            return None
+
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap())
+
+        session = VoiceSession(
+            websocket,
+            self.pipeline_factory(),
+            self.chunk_samples,
+            self.buffer_samples,
+            self.send_queue_samples,
+            self.slow_client_policy,
+            self.drop_silence,
+            send_lag=self.send_lag,
+        )
+        self.sessions[session.id] = session
+        self.opened += 1
+        try:
+            await session.start()
+        except BaseException:
+            await self.close(session.id, code=1011)
+            raise
+        return session
+
+    async def close(self, session_id: str, code: int = 1000):
+        """Close a session and release its tasks and pipeline. Safe to call twice."""
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            await session.close(code)
+
+    async def evict_idle(self):
+        """Close every session that has been idle for longer than idle_timeout."""
+        now = time.monotonic()
+        idle = [
+            session_id
+            for session_id, session in self.sessions.items()
+            if now - session.last_activity > self.idle_timeout
+        ]
+        for session_id in idle:
+            logger.info(f"Closing idle session {session_id}")
+            self.idle_closed += 1
+            await self.close(session_id, code=1001)
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_timeout / 4))
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                logger.warning(f"Error closing idle sessions: {e}")
+
+    @property
+    def ready(self) -> bool:
+        """Whether this server can take another session."""
+        return not self.draining and len(self.sessions) < self.max_sessions
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self.sessions),
+            "draining": self.draining,
+            "max_sessions": self.max_sessions,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "idle_closed": self.idle_closed,
+            "sessions": [session.stats() for session in self.sessions.values()],
+        }
+
+    async def shutdown(self):
+        """Close every session and stop the reaper."""
+        if self._reaper is not None:
+            self._reaper.cancel()
+        await asyncio.gather(
+            *(self.close(session_id, code=1001) for session_id in list(self.sessions)),
+            return_exceptions=True,
+        )
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from browser_use import Browser
+from browser_use.browser.context import BrowserContext, BrowserContextConfig
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserContextPool:
+    """Pre-warmed browser contexts shared by concurrent web searches.
+
+    Callers borrow a context with acquire(). When every context is busy,
+    callers wait in FIFO order instead of piling onto one page. A context is
+    health-checked when it comes back and is closed and replaced if it has
+    crashed or has served max_uses searches.
+    """
+
+    def __init__(
+        self,
+        browser: Browser,
+        size: int = 2,
+        max_uses: int = 20,
+        health_check_timeout: float = 5.0,
+        config: Optional[BrowserContextConfig] = None,
+    ):
+        """
+        Args:
+            browser: Browser the contexts are created in
+            size: Number of contexts, i.e. how many searches run at once
+            max_uses: Searches after which a context is replaced
+            health_check_timeout: Seconds a health check may take
+            config: Configuration for new contexts
+        """
+        self.browser = browser
+        self.size = size
+        self.max_uses = max_uses
+        self.health_check_timeout = health_check_timeout
+        self.config = config or BrowserContextConfig()
+        # None marks a slot whose context still has to be created
+        self._idle: asyncio.Queue[Optional[BrowserContext]] = asyncio.Queue()
+        self._uses: dict[BrowserContext, int] = {}
+        self._start_lock = asyncio.Lock()
+        self._started = False
+        self.recycled = 0
+
+    async def _new_context(self) -> Optional[BrowserContext]:
+        try:
+            context = await self.browser.new_context(self.config)
+            # Open the underlying browser context now rather than on first use
+            await context.get_session()
+        except Exception as e:
+            logger.warning(f"Failed to create browser context: {e}")
+            return None
+        self._uses[context] = 0
+        return context
+
+    async def start(self):
+        """Create and warm up every context. Called lazily by acquire()."""
+        async with self._start_lock:
+            if self._started:
+                return
+            contexts = await asyncio.gather(*(self._new_context() for _ in range(self.size)))
+            for context in contexts:
+                self._idle.put_nowait(context)
+            self._started = True
+
+    async def _healthy(self, context: BrowserContext) -> bool:
+        """Check the context still responds, leaving it on a blank page."""
+        try:
+            page = await asyncio.wait_for(context.get_current_page(), self.health_check_timeout)
+            await asyncio.wait_for(page.goto("about:blank"), self.health_check_timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"Browser context failed health check: {e}")
+            return False
+
+    async def _close(self, context: BrowserContext):
+        self._uses.pop(context, None)
+        try:
+            await context.close()
+        except Exception as e:
+            logger.debug(f"Error closing browser context: {e}")
+
+    async def _release(self, context: Optional[BrowserContext]):
+        if context is not None:
+            self._uses[context] += 1
+            if self._uses[context] >= self.max_uses or not await self._healthy(context):
+                await self._close(context)
+                self.recycled += 1
+                context = await self._new_context()
+        self._idle.put_nowait(context)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[BrowserContext]:
+        """Borrow a context for the duration of the block."""
+        await self.start()
+        context = await self._idle.get()
+        try:
+            if context is None:
+                context = await self._new_context()
+                if context is None:
+                    raise RuntimeError("No browser context available")
+            yield context
+        finally:
+            # Shielded so a cancelled search still returns its slot
+            await asyncio.shield(self._release(context))
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "recycled": self.recycled,
+        }
+
+    async def close(self):
+        """Close every idle context."""
+        while not self._idle.empty():
+            context = self._idle.get_nowait()
+            if context is not None:
+                await self._close(context)
@@ -0,0 +1,290 @@
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def normalize_text(text: str, stopwords: Iterable[str] = ()) -> str:
+    """Normalize text for use as a cache key.
+
+    Casefolds, strips punctuation, collapses whitespace and drops stopwords,
+    so near-identical phrasings of the same question share a key.
+    """
+    stopwords = set(stopwords)
+    text = re.sub(r"['\u2019]", "", text.casefold())
+    words = re.sub(r"[^\w\s]", " ", text).split()
+    return " ".join(word for word in words if word not in stopwords)
+
+
+class TTLCache:
+    """In-memory LRU cache whose entries expire after ttl seconds.
+
+    Keeps hit, miss and eviction counters so callers can report how
+    effective the cache is.
+    """
+
+    _clock = staticmethod(time.monotonic)
+
+    def __init__(self, max_size: int = 256, ttl: Optional[float] = 300.0):
+        """
+        Args:
+            max_size: Maximum number of entries before the least recently used is evicted
+            ttl: Seconds an entry stays valid, or None for no expiry
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and self._clock() - stored_at > self.ttl
+
+    def _get_memory(self, key: Hashable) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        if self._expired(entry[0]):
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def _set_memory(self, key: Hashable, value: Any, stored_at: float) -> None:
+        self._data[key] = (stored_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for key, or default on a miss."""
+        value = self._get_memory(key)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._set_memory(key, value, self._clock())
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class PersistentTTLCache(TTLCache):
+    """TTLCache backed by a SQLite file.
+
+    Recently used entries live in memory; every entry is also written to
+    SQLite, so entries evicted from memory, or from before a restart, are
+    still found there and promoted back into memory. Keys must be strings
+    and values JSON-serializable.
+
+    Async code should use aget() and aset(), which do the disk I/O in a
+    thread. Expired and excess rows are pruned every prune_every writes
+    rather than on each one. Several processes may share the file; when
+    it stays locked a read counts as a miss and a write only reaches
+    memory.
+    """
+
+    _clock = staticmethod(time.time)
+
+    def __init__(
+        self,
+        path: str,
+        max_size: int = 256,
+        ttl: Optional[float] = 300.0,
+        max_disk_size: int = 10_000,
+        prune_every: int = 100,
+        busy_timeout: float = 2.0,
+    ):
+        """
+        Args:
+            path: SQLite database file
+            max_size: Maximum number of entries kept in memory
+            ttl: Seconds an entry stays valid, or None for no expiry
+            max_disk_size: Maximum number of entries kept on disk, enforced
+                every prune_every writes
+            prune_every: Writes between pruning expired and excess rows
+            busy_timeout: Seconds to wait for another process holding the file
+        """
+        super().__init__(max_size=max_size, ttl=ttl)
+        self.path = path
+        self.max_disk_size = max_disk_size
+        self.prune_every = prune_every
+        self.disk_hits = 0
+        self.disk_errors = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        # WAL lets worker processes read while another one writes
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_stored_at ON cache (stored_at)")
+        self._db.commit()
+
+    # _fetch_row() and _store_row() may run in a worker thread, so they only
+    # touch SQLite; counters and the memory tier are updated by the caller
+
+    def _fetch_row(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT value, stored_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+
+    def _store_row(self, key: str, value: Any, stored_at: float) -> None:
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, stored_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), stored_at),
+                )
+                self._writes += 1
+                if self._writes >= self.prune_every:
+                    self._writes = 0
+                    self._prune(stored_at)
+                self._db.commit()
+            except sqlite3.OperationalError:
+                self._db.rollback()
+                raise
+
+    def _promote(self, key: str, row: Optional[Tuple[str, float]]) -> Any:
+        if row is None or self._expired(row[1]):
+            return _MISSING
+        value = json.loads(row[0])
+        self._set_memory(key, value, row[1])
+        self.disk_hits += 1
+        return value
+
+    def _disk_error(self, action: str, error: sqlite3.OperationalError) -> None:
+        self.disk_errors += 1
+        logger.warning(f"Cache {action} {self.path} failed: {error}")
+
+    def _read_disk(self, key: str) -> Any:
+        try:
+            row = self._fetch_row(key)
+        except sqlite3.OperationalError as e:
+            self._disk_error("read from", e)
+            return _MISSING
+        return self._promote(key, row)
+
+    async def _aread_disk(self, key: str) -> Any:
+        try:
+            row = await asyncio.to_thread(self._fetch_row, key)
+        except sqlite3.OperationalError as e:
+            self._disk_error("read from", e)
+            return _MISSING
+        return self._promote(key, row)
+
+    def _write_disk(self, key: str, value: Any, stored_at: float) -> None:
+        try:
+            self._store_row(key, value, stored_at)
+        except sqlite3.OperationalError as e:
+            self._disk_error("write to", e)
+
+    async def _awrite_disk(self, key: str, value: Any, stored_at: float) -> None:
+        try:
+            await asyncio.to_thread(self._store_row, key, value, stored_at)
+        except sqlite3.OperationalError as e:
+            self._disk_error("write to", e)
+
+    def _prune(self, now: float) -> None:
+        # Called with the lock held
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM cache WHERE stored_at < ?", (now - self.ttl,))
+        # Keep the newest max_disk_size rows; the index makes the cutoff cheap
+        self._db.execute(
+            "DELETE FROM cache WHERE stored_at < "
+            "(SELECT stored_at FROM cache ORDER BY stored_at DESC LIMIT 1 OFFSET ?)",
+            (self.max_disk_size - 1,),
+        )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached value for key from memory or disk, or default on a miss."""
+        value = self._get_memory(key)
+        if value is _MISSING:
+            value = self._read_disk(key)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    async def aget(self, key: str, default: Any = None) -> Any:
+        """Like get(), reading the disk in a thread."""
+        value = self._get_memory(key)
+        if value is _MISSING:
+            value = await self._aread_disk(key)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        stored_at = self._clock()
+        self._set_memory(key, value, stored_at)
+        self._write_disk(key, value, stored_at)
+
+    async def aset(self, key: str, value: Any) -> None:
+        """Like set(), writing the disk in a thread."""
+        stored_at = self._clock()
+        self._set_memory(key, value, stored_at)
+        await self._awrite_disk(key, value, stored_at)
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        value = super().pop(key, default)
+        with self._lock:
+            self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._db.commit()
+        return value
+
+    def clear(self) -> None:
+        super().clear()
+        with self._lock:
+            self._db.execute("DELETE FROM cache")
+            self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            (disk_size,) = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()
+        return {
+            **super().stats(),
+            "disk_size": disk_size,
+            "disk_hits": self.disk_hits,
+            "disk_errors": self.disk_errors,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -1,5 +1,16 @@
 const { createApp, ref, onMounted, nextTick } = Vue;
 const WS_ENDPOINT = 'ws://localhost:8000/ws';
+// Codecs offered to the server, most compact first
+const SUPPORTED_CODECS = ['mulaw', 'pcm16'];
+
+// Float sample for every G.711 mu-law byte
+const MULAW_DECODE = new Float32Array(256);
+for (let i = 0; i < 256; i++) {
+  const code = ~i & 0xff;
+  const exponent = (code >> 4) & 0x07;
+  const magnitude = ((((code & 0x0f) << 3) + 0x84) << exponent) - 0x84;
+  MULAW_DECODE[i] = ((code & 0x80) ? -magnitude : magnitude) / 32767;
+}
 
 const app = createApp({
   setup() {
@@ -11,6 +22,10 @@ const app = createApp({
     let playbackContext = null;
     let audioQueue = [];
     let isPlaying = false;
+    let currentSource = null;
+    let codec = null;
+    // Codec of audio from the server; it may switch to a more compact one if we lag
+    let playbackCodec = null;
 
     // Toggle the assistant on/off
     const toggleAssistant = async () => {
@@ -31,8 +46,15 @@ const app = createApp({
       socket.binaryType = "arraybuffer";
       socket.onopen = () => {
         console.log("WebSocket connected.");
+        socket.send(JSON.stringify({ type: "hello", codecs: SUPPORTED_CODECS }));
+      };
+      socket.onmessage = (event) => {
+        if (typeof event.data === "string") {
+          handleControlMessage(JSON.parse(event.data));
+        } else {
+          handleIncomingAudio(event);
+        }
       };
-      socket.onmessage = handleIncomingAudio;
 
       // Create an AudioContext matching the desired sample rate.
       audioContext = new AudioContext({ sampleRate: 24000 });
@@ -53,14 +75,17 @@ const app = createApp({
           // Add silence detection options
           silenceDetection: true,
           silenceThreshold: 0.001, // Adjust this threshold as needed
-          silenceFrames: 5 // Number of consecutive silent frames to consider as silence
+          silenceFrames: 5, // Number of consecutive silent frames to consider as silence
+          codec: codec || "pcm16"
         }
       });
       console.log("Worklet node created with silence detection.");
 
       // When the worklet produces PCM chunks, send them via WebSocket.
       workletNode.port.onmessage = (e) => {
-        if (socket && socket.readyState === WebSocket.OPEN) {
+        // Hold audio back until the server has picked a codec, and drop
+        // buffers the worklet encoded before it learned which one
+        if (socket && socket.readyState === WebSocket.OPEN && codec && e.data.codec === codec) {
           // e.data will contain an object with the audio data and a silence flag
           if (e.data.isSilent === false) {
             // Only send non-silent audio
@@ -90,6 +115,32 @@ const app = createApp({
       // Clear audio queue
       audioQueue = [];
       isPlaying = false;
+      codec = null;
+      playbackCodec = null;
+    };
+
+    // Handle JSON control messages from the server.
+    const handleControlMessage = (message) => {
+      if (message.type === "codec") {
+        codec = message.codec;
+        playbackCodec = message.codec;
+        console.log(`Using ${codec} audio codec.`);
+        if (workletNode) {
+          workletNode.port.postMessage({ codec });
+        }
+      } else if (message.type === "flush") {
+        // The user interrupted: drop queued audio and stop what is playing.
+        audioQueue = [];
+        if (currentSource) {
+          currentSource.onended = null;
+          currentSource.stop();
+          currentSource = null;
+        }
+        isPlaying = false;
+      } else if (message.type === "playback_codec") {
+        playbackCodec = message.codec;
+        console.log(`Server switched playback to ${playbackCodec}.`);
+      }
     };
 
     // Handle incoming audio chunks from the server.
@@ -98,12 +149,22 @@ const app = createApp({
         playbackContext = new AudioContext({ sampleRate: 24000 });
       }
       const arrayBuffer = event.data;
-      // Convert the received ArrayBuffer (16-bit PCM) to a Float32Array.
-      const int16Array = new Int16Array(arrayBuffer);
-      const float32Array = new Float32Array(int16Array.length);
-      for (let i = 0; i < int16Array.length; i++) {
-        // Normalize from 16-bit integer to float in [-1, 1].
-        float32Array[i] = int16Array[i] / 32767;
+      let float32Array;
+      if (playbackCodec === "mulaw") {
+        // Decode mu-law bytes straight to floats with the lookup table.
+        const bytes = new Uint8Array(arrayBuffer);
+        float32Array = new Float32Array(bytes.length);
+        for (let i = 0; i < bytes.length; i++) {
+          float32Array[i] = MULAW_DECODE[bytes[i]];
+        }
+      } else {
+        // Convert the received ArrayBuffer (16-bit PCM) to a Float32Array.
+        const int16Array = new Int16Array(arrayBuffer);
+        float32Array = new Float32Array(int16Array.length);
+        for (let i = 0; i < int16Array.length; i++) {
+          // Normalize from 16-bit integer to float in [-1, 1].
+          float32Array[i] = int16Array[i] / 32767;
+        }
       }
       
       // Only create and add to queue if there are frames to process
@@ -128,6 +189,7 @@ const app = createApp({
     const playNextInQueue = () => {
       if (audioQueue.length === 0) {
         isPlaying = false;
+        currentSource = null;
         return;
       }
       
@@ -140,6 +202,7 @@ const app = createApp({
       // When this chunk finishes, play the next one
       source.onended = playNextInQueue;
       
+      currentSource = source;
       source.start();
     };
 
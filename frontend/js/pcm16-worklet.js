@@ -1,3 +1,19 @@
+// Encode one 16-bit sample as a G.711 mu-law byte.
+function encodeMuLaw(sample) {
+  let sign = 0;
+  if (sample < 0) {
+    sample = -sample;
+    sign = 0x80;
+  }
+  sample = Math.min(sample, 32635) + 0x84;
+  let exponent = 7;
+  for (let mask = 0x4000; (sample & mask) === 0 && exponent > 0; mask >>= 1) {
+    exponent--;
+  }
+  const mantissa = (sample >> (exponent + 3)) & 0x0f;
+  return ~(sign | (exponent << 4) | mantissa) & 0xff;
+}
+
 class PCM16Processor extends AudioWorkletProcessor {
   constructor(options) {
     super();
@@ -8,6 +24,13 @@ class PCM16Processor extends AudioWorkletProcessor {
     this.silenceFrames = processorOptions.silenceFrames || 10;
     this.silentCount = 0;
     this.isSilent = true;
+    // Wire codec negotiated with the server: "pcm16" or "mulaw"
+    this.codec = processorOptions.codec || "pcm16";
+    this.port.onmessage = (e) => {
+      if (e.data.codec) {
+        this.codec = e.data.codec;
+      }
+    };
   }
 
   process(inputs, outputs) {
@@ -51,11 +74,21 @@ class PCM16Processor extends AudioWorkletProcessor {
       this.isSilent = false;
     }
     
-    // Send the PCM data to the main thread, along with silence info
+    // Encode for the wire: mu-law halves the bytes sent
+    let encoded = pcm16;
+    if (this.codec === "mulaw") {
+      encoded = new Uint8Array(pcm16.length);
+      for (let i = 0; i < pcm16.length; i++) {
+        encoded[i] = encodeMuLaw(pcm16[i]);
+      }
+    }
+    
+    // Send the encoded data to the main thread, along with its codec and silence info
     this.port.postMessage({
-      buffer: pcm16.buffer,
+      buffer: encoded.buffer,
+      codec: this.codec,
       isSilent: this.isSilent
-    }, [pcm16.buffer]);
+    }, [encoded.buffer]);
     
     return true;
   }
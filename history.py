@@ -0,0 +1,142 @@
+import asyncio
+import json
+import logging
+from typing import Optional
+
+from agents import Agent, Runner, TResponseInputItem
+
+logger = logging.getLogger(__name__)
+
+# Rough average for English text with OpenAI tokenizers
+CHARS_PER_TOKEN = 4
+
+summarizer = Agent(
+    name="Summarizer",
+    instructions="""
+    You maintain a running summary of a conversation between a user and an assistant.
+    Merge the existing summary with the new turns into one concise summary.
+    Keep names, facts, decisions, open questions and results of tool calls.
+    Leave out greetings and filler. Answer with the summary only.
+    """,
+    model="gpt-4o-mini",
+)
+
+
+def estimate_tokens(item: TResponseInputItem) -> int:
+    """Estimate how many prompt tokens an input item costs."""
+    return len(json.dumps(item, default=str)) // CHARS_PER_TOKEN + 1
+
+
+def _item_text(item: TResponseInputItem) -> str:
+    """Render an input item as a line of transcript for the summarizer."""
+    content = item.get("content")
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    if content:
+        return f"{item.get('role', 'assistant')}: {content}"
+    if item.get("type") == "function_call":
+        return f"tool call {item.get('name')}({item.get('arguments')})"
+    if item.get("type") == "function_call_output":
+        return f"tool result: {str(item.get('output'))[:500]}"
+    return ""
+
+
+class ConversationHistory:
+    """Token-bounded conversation history for a voice workflow.
+
+    The last keep_turns turns are kept verbatim. Once the verbatim turns
+    exceed max_tokens, or there are more than keep_turns of them, the older
+    turns are folded into a rolling summary by a background task, so the
+    prompt sent each turn stays roughly the same size however long the
+    session runs. Turns waiting to be summarized are still sent verbatim,
+    so nothing is lost while the summarizer runs.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 4000,
+        keep_turns: int = 4,
+        summarizer_agent: Agent = summarizer,
+    ):
+        """
+        Args:
+            max_tokens: Token budget for the verbatim turns
+            keep_turns: Number of most recent turns that are never summarized
+            summarizer_agent: Agent used to compress older turns
+        """
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summarizer_agent = summarizer_agent
+        self.summary = ""
+        self._turns: list[list[TResponseInputItem]] = []
+        self._pending: list[list[TResponseInputItem]] = []
+        self._task: Optional[asyncio.Task] = None
+        self.summaries = 0
+
+    @staticmethod
+    def _tokens(turns: list[list[TResponseInputItem]]) -> int:
+        return sum(estimate_tokens(item) for turn in turns for item in turn)
+
+    def items(self, *new_items: TResponseInputItem) -> list[TResponseInputItem]:
+        """Return the input list for the next turn, followed by new_items."""
+        items: list[TResponseInputItem] = []
+        if self.summary:
+            items.append(
+                {
+                    "role": "system",
+                    "content": f"Summary of the earlier conversation:\n{self.summary}",
+                }
+            )
+        for turn in self._pending + self._turns:
+            items.extend(turn)
+        items.extend(new_items)
+        return items
+
+    def add_turn(self, items: list[TResponseInputItem]):
+        """Record a finished turn and compact older turns if over budget.
+
+        Args:
+            items: The user message followed by every item the turn produced
+        """
+        self._turns.append(list(items))
+        while len(self._turns) > 1 and (
+            len(self._turns) > self.keep_turns or self._tokens(self._turns) > self.max_tokens
+        ):
+            self._pending.append(self._turns.pop(0))
+        if self._pending and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._summarize())
+
+    async def _summarize(self):
+        """Fold pending turns into the summary until none are left."""
+        while self._pending:
+            turns = list(self._pending)
+            transcript = "\n".join(
+                line for turn in turns for line in map(_item_text, turn) if line
+            )
+            prompt = f"Existing summary:\n{self.summary or '(none)'}\n\nNew turns:\n{transcript}"
+            try:
+                result = await Runner.run(self.summarizer_agent, prompt)
+            except Exception as e:
+                # Keep the turns verbatim and retry on the next compaction
+                logger.warning(f"Failed to summarize conversation history: {e}")
+                return
+            self.summary = result.final_output
+            self._pending = self._pending[len(turns):]
+            self.summaries += 1
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "turns": len(self._turns),
+            "pending_turns": len(self._pending),
+            "prompt_tokens": sum(map(estimate_tokens, self.items())),
+            "summaries": self.summaries,
+        }
+
+    async def close(self):
+        """Cancel a running summarization."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
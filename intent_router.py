@@ -0,0 +1,120 @@
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Optional
+
+from cache import normalize_text
+
+
+@dataclass
+class Intent:
+    name: str
+    patterns: list[str]
+    handler: Callable[[str], str]
+
+
+@dataclass
+class IntentMatch:
+    intent: str
+    response: str
+
+
+class IntentRouter:
+    """Answers canned intents locally, without a model round trip.
+
+    Each intent has regex patterns that must match the whole normalized
+    transcription (see cache.normalize_text: casefolded, no punctuation).
+    All patterns are compiled into a single alternation, so routing is one
+    regex match regardless of how many intents are registered. Intents
+    registered first win when several match.
+    """
+
+    def __init__(self):
+        self.intents: list[Intent] = []
+        self._pattern: Optional[re.Pattern] = None
+        self._groups: dict[str, Intent] = {}
+        self.hits: dict[str, int] = {}
+        self.misses = 0
+        self.route_time = 0.0
+
+    def register(self, name: str, patterns: list[str], handler: Callable[[str], str]):
+        """Register an intent.
+
+        Args:
+            name: Intent name used in metrics
+            patterns: Regexes matched against the whole normalized transcription
+            handler: Called with the transcription, returns the text to speak
+        """
+        self.intents.append(Intent(name, patterns, handler))
+        self.hits.setdefault(name, 0)
+        self._pattern = None
+
+    def intent(self, name: str, *patterns: str):
+        """Decorator form of register()."""
+        def decorator(handler: Callable[[str], str]) -> Callable[[str], str]:
+            self.register(name, list(patterns), handler)
+            return handler
+        return decorator
+
+    def _compile(self) -> re.Pattern:
+        alternatives = []
+        self._groups = {}
+        for index, intent in enumerate(self.intents):
+            group = f"_{index}"
+            self._groups[group] = intent
+            alternatives.append(f"(?P<{group}>{'|'.join(f'(?:{p})' for p in intent.patterns)})")
+        return re.compile("|".join(alternatives) or "(?!)", re.DOTALL)
+
+    def route(self, transcription: str) -> Optional[IntentMatch]:
+        """Return the local answer for the transcription, or None to use the model."""
+        started = time.perf_counter()
+        if self._pattern is None:
+            self._pattern = self._compile()
+        match = self._pattern.fullmatch(normalize_text(transcription))
+        try:
+            if match is None:
+                self.misses += 1
+                return None
+            intent = self._groups[match.lastgroup]
+            self.hits[intent.name] += 1
+            return IntentMatch(intent.name, intent.handler(transcription))
+        finally:
+            self.route_time += time.perf_counter() - started
+
+    def stats(self) -> dict:
+        routed = sum(self.hits.values()) + self.misses
+        return {
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "avg_route_us": self.route_time / routed * 1e6 if routed else 0.0,
+        }
+
+
+def register_default_intents(router: IntentRouter):
+    """Register greetings, thanks, time, date and stop/cancel intents."""
+    router.register(
+        "greeting",
+        [r"(?:hi|hello|hey|good (?:morning|afternoon|evening))(?: there)?(?: assistant)?"],
+        lambda _: "Hello! How can I help?",
+    )
+    router.register(
+        "thanks",
+        [r"(?:thank you|thanks)(?: (?:so|very) much| a lot)?"],
+        lambda _: "You're welcome!",
+    )
+    router.register(
+        "time",
+        [r"(?:whats|what is) the time(?: now)?", r"what time is it(?: now)?"],
+        lambda _: f"It's {datetime.now().strftime('%I:%M %p').lstrip('0')}.",
+    )
+    router.register(
+        "date",
+        [r"(?:whats|what is) (?:the date|todays date)(?: today)?", r"what day is (?:it|today)"],
+        lambda _: f"Today is {datetime.now().strftime('%A, %B %d, %Y')}.",
+    )
+    router.register(
+        "stop",
+        [r"(?:please )?(?:stop|cancel|never ?mind|be quiet|shut up|thats all)(?: please)?"],
+        lambda _: "Okay.",
+    )
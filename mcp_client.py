@@ -1,15 +1,27 @@
 import asyncio
 import argparse
+import bisect
+import hashlib
+import importlib
 import json
 import logging
+import os
 import sys
-from contextlib import AsyncExitStack
+import time
+from collections import Counter
+from contextlib import AsyncExitStack, nullcontext
+from pathlib import Path
+from typing import Iterable, Optional, Union
 
+import anyio
 from dotenv import load_dotenv
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
+from mcp.types import CallToolResult, TextContent, Tool
 from agents import Agent, Runner, FunctionTool
 
+from cache import TTLCache
+
 # Load environment variables
 load_dotenv()
 
@@ -18,43 +30,519 @@ logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+def _is_connection_error(error: BaseException) -> bool:
+    """Whether error means the server process or its pipe has gone away."""
+    if isinstance(
+        error,
+        (
+            anyio.ClosedResourceError,
+            anyio.BrokenResourceError,
+            anyio.EndOfStream,
+            ConnectionError,
+            EOFError,
+        ),
+    ):
+        return True
+    return "Connection closed" in str(error)
+
+
+class ServerConnection:
+    """One MCP server subprocess and its ClientSession.
+
+    The stdio transport and session are entered and exited inside a single
+    background task, as anyio requires, so a connection can be stopped or
+    restarted from any task.
+    """
+
+    def __init__(self, server_params: StdioServerParameters):
+        self.server_params = server_params
+        self.session: Optional[ClientSession] = None
+        self.in_flight = 0
+        self.restarts = 0
+        self._task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._error: Optional[BaseException] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Start the server process and wait until the session is initialized."""
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._error = None
+        self._task = asyncio.create_task(self._run())
+        await self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    async def _run(self):
+        try:
+            async with stdio_client(self.server_params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._stop.wait()
+        except Exception as e:
+            self._error = e
+            logging.warning(f"MCP server {self.server_params.args} stopped: {e}")
+        finally:
+            self.session = None
+            self._ready.set()
+
+    async def stop(self):
+        """Shut the session and server process down."""
+        if self._task is None:
+            return
+        self._stop.set()
+        try:
+            await self._task
+        except Exception:
+            pass
+        self._task = None
+
+    async def restart(self):
+        await self.stop()
+        self.restarts += 1
+        await self.start()
+
+    async def call_tool(self, name: str, arguments: dict):
+        self.in_flight += 1
+        try:
+            return await self.session.call_tool(name, arguments)
+        except Exception as e:
+            if _is_connection_error(e):
+                # Mark the connection dead so the pool restarts it
+                self.session = None
+            raise
+        finally:
+            self.in_flight -= 1
+
+
+class ServerPool:
+    """Several identical MCP server processes behind one call_tool.
+
+    Each call goes to the live member with the fewest calls in flight, so
+    concurrent tool calls run in parallel across processes. Dead members are
+    restarted in the background. A pool that was never started explicitly
+    starts on its first call.
+    """
+
+    def __init__(self, server_params: StdioServerParameters, size: int = 1):
+        self.server_params = server_params
+        self.members = [ServerConnection(server_params) for _ in range(max(1, size))]
+        self._restarting: dict[ServerConnection, asyncio.Task] = {}
+        self._start_lock = asyncio.Lock()
+        self.started = False
+
+    async def start(self):
+        """Start every member concurrently."""
+        async with self._start_lock:
+            if self.started:
+                return
+            try:
+                await asyncio.gather(*(member.start() for member in self.members))
+            except BaseException:
+                await asyncio.gather(*(member.stop() for member in self.members))
+                raise
+            self.started = True
+
+    async def _restart(self, member: ServerConnection):
+        logging.warning(f"Restarting MCP server {self.server_params.args}")
+        try:
+            await member.restart()
+        except Exception as e:
+            logging.error(f"Failed to restart MCP server {self.server_params.args}: {e}")
+
+    def _restart_in_background(self, member: ServerConnection):
+        if member in self._restarting:
+            return
+        task = asyncio.create_task(self._restart(member))
+        self._restarting[member] = task
+        task.add_done_callback(lambda _: self._restarting.pop(member, None))
+
+    def _pick(self) -> ServerConnection:
+        live = []
+        for member in self.members:
+            if member.alive:
+                live.append(member)
+            else:
+                self._restart_in_background(member)
+        if not live:
+            raise RuntimeError("No MCP server process is available")
+        return min(live, key=lambda member: member.in_flight)
+
+    async def list_tools(self):
+        await self.start()
+        return await self._pick().session.list_tools()
+
+    async def call_tool(self, name: str, arguments: dict):
+        await self.start()
+        member = self._pick()
+        try:
+            return await member.call_tool(name, arguments)
+        finally:
+            if not member.alive:
+                self._restart_in_background(member)
+
+    async def stop(self):
+        for task in list(self._restarting.values()):
+            task.cancel()
+        await asyncio.gather(*(member.stop() for member in self.members))
+
+
+class InProcessServer:
+    """A FastMCP server mounted directly in the client process.
+
+    Tools are called as plain coroutines, without JSON-RPC encoding, pipes
+    or a second event loop. Tools listed in out_of_process are still sent to
+    a stdio ServerPool, which starts on their first call, so sandboxed tools
+    such as execute_code keep running in their own process.
+    """
+
+    def __init__(
+        self,
+        server,
+        fallback: Optional[ServerPool] = None,
+        out_of_process: Iterable[str] = (),
+    ):
+        self.server = server
+        self.fallback = fallback
+        self.out_of_process = set(out_of_process)
+        if self.out_of_process and fallback is None:
+            raise ValueError("out_of_process tools need a fallback ServerPool")
+        self.started = True
+
+    async def start(self):
+        pass
+
+    async def list_tools(self):
+        return await self.server.list_tools()
+
+    async def call_tool(self, name: str, arguments: dict) -> CallToolResult:
+        if name in self.out_of_process:
+            return await self.fallback.call_tool(name, arguments)
+        try:
+            result = await self.server.call_tool(name, arguments)
+        except Exception as e:
+            return CallToolResult(content=[TextContent(type="text", text=str(e))], isError=True)
+        # Newer FastMCP versions return (content, structured_content)
+        if isinstance(result, tuple):
+            result = result[0]
+        elif isinstance(result, dict):
+            result = [TextContent(type="text", text=json.dumps(result))]
+        return CallToolResult(content=list(result), isError=False)
+
+    async def stop(self):
+        if self.fallback is not None:
+            await self.fallback.stop()
+
+
+def _load_object(target: str):
+    """Import "module:attribute" and return the attribute."""
+    module_name, _, attribute = target.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "mcp")
+
+
+def _resolve_command(command: str) -> str:
+    """Run "python" servers with this interpreter so they share its virtualenv."""
+    return sys.executable if command in ("python", "python3") else command
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of call latencies in seconds."""
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th percentile (inf past the last bucket)."""
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.BUCKETS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "buckets": dict(zip([*map(str, self.BUCKETS), "+inf"], self.counts)),
+        }
+
+
+def _manifest_key(server_params: StdioServerParameters) -> str:
+    """Key cached tool schemas by server command, args and the mtimes of files they name."""
+    parts = [server_params.command, *server_params.args]
+    mtimes = [os.stat(part).st_mtime_ns for part in parts if os.path.isfile(part)]
+    return hashlib.sha256(json.dumps([parts, mtimes]).encode()).hexdigest()
+
+
+def _is_pure(mcp_tool) -> bool:
+    """Whether the server annotates the tool as read-only, idempotent and closed-world."""
+    annotations = getattr(mcp_tool, "annotations", None)
+    return bool(
+        annotations
+        and getattr(annotations, "readOnlyHint", False)
+        and getattr(annotations, "idempotentHint", False)
+        and getattr(annotations, "openWorldHint", True) is False
+    )
+
+
 class MCPClient:
-    def __init__(self, agent=None):
+    def __init__(
+        self,
+        agent=None,
+        pool_size: int = 1,
+        cache_tools: Optional[set[str]] = None,
+        cache_size: int = 256,
+        cache_ttl: Optional[float] = 300.0,
+        manifest_path: Optional[str] = ".mcp_tool_manifest.json",
+        tool_limits: Optional[dict[str, dict]] = None,
+        default_tool_timeout: Optional[float] = None,
+    ):
         """Initialize the MCP client.
         
         Args:
             agent: Optional pre-configured Agent instance to use instead of creating one
+            pool_size: Number of server processes to start per server
+            cache_tools: Names of tools whose results may be cached, in addition
+                to tools the server annotates as pure
+            cache_size: Maximum cached results per tool
+            cache_ttl: Seconds a cached result stays valid
+            manifest_path: File where tool schemas are saved so later runs can
+                register tools without starting the server, or None to disable
+            tool_limits: Per-tool {"max_concurrency": int, "timeout": seconds}
+            default_tool_timeout: Deadline for tools without their own timeout
         """
-        self.session = None
+        self.servers: dict[str, Union[ServerPool, InProcessServer]] = {}
+        self.startup_times: dict[str, float] = {}
         self.exit_stack = AsyncExitStack()
         self.agent = agent
+        self.pool_size = pool_size
+        self.cache_tools = set(cache_tools or ())
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.tool_caches: dict[str, TTLCache] = {}
+        self._server_cache_tools: dict[str, set[str]] = {}
+        self.manifest_path = manifest_path
+        self._manifest: Optional[dict] = None
+        self.tool_limits = dict(tool_limits or {})
+        self.default_tool_timeout = default_tool_timeout
+        self.tool_latency: dict[str, LatencyHistogram] = {}
+        self.tool_in_flight: Counter = Counter()
+
+    def _load_manifest(self) -> dict:
+        if self._manifest is None:
+            self._manifest = {}
+            if self.manifest_path and os.path.exists(self.manifest_path):
+                try:
+                    with open(self.manifest_path) as f:
+                        self._manifest = json.load(f)
+                except (OSError, ValueError) as e:
+                    logging.warning(f"Ignoring unreadable tool manifest {self.manifest_path}: {e}")
+        return self._manifest
+
+    def _save_manifest(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    async def _start_server(self, name: str, server_params: StdioServerParameters, pool_size: int):
+        """Start a server pool and list its tools, recording how long it took.
+
+        If the manifest already has this server's tool schemas, they are used
+        as-is and the server processes start on the first tool call instead.
+        """
+        start = time.perf_counter()
+        server = ServerPool(server_params, size=pool_size)
+        self.servers[name] = server
+
+        key = _manifest_key(server_params) if self.manifest_path else None
+        cached = self._load_manifest().get(key) if key else None
+        if cached is not None:
+            tools = [Tool.model_validate(tool) for tool in cached]
+            self.startup_times[name] = time.perf_counter() - start
+            logging.info(f"Loaded tools for MCP server '{name}' from {self.manifest_path}")
+            return tools
+
+        await server.start()
+        response = await server.list_tools()
+        self.startup_times[name] = time.perf_counter() - start
+        logging.info(f"Started MCP server '{name}' in {self.startup_times[name]:.2f}s")
+        if key:
+            self._manifest[key] = [tool.model_dump(mode="json") for tool in response.tools]
+            self._save_manifest()
+        return response.tools
+
+    def _register_tools(self, server_tools: dict[str, list]):
+        """Add tools from several servers to the agent.
+
+        Tool names that clash with another server's tool or one the agent
+        already has are prefixed with the server name.
+        """
+        counts = Counter(tool.name for tools in server_tools.values() for tool in tools)
+        existing = {tool.name for tool in self.agent.tools}
+        for name, tools in server_tools.items():
+            for tool in tools:
+                tool_name = tool.name
+                if counts[tool_name] > 1 or tool_name in existing:
+                    tool_name = f"{name}_{tool.name}"
+                existing.add(tool_name)
+                cacheable = (
+                    tool.name in self.cache_tools
+                    or tool.name in self._server_cache_tools.get(name, ())
+                    or _is_pure(tool)
+                )
+                self.agent.tools.append(
+                    self._create_tool_from_mcp(tool, self.servers[name], tool_name, cacheable)
+                )
+
+    async def mount_server(
+        self,
+        name: str,
+        server,
+        server_params: Optional[StdioServerParameters] = None,
+        out_of_process_tools: Iterable[str] = (),
+        pool_size: Optional[int] = None,
+    ):
+        """Mount a FastMCP instance in this process and return its tools.
+
+        Args:
+            name: Name to register the server under
+            server: The FastMCP instance, e.g. mcp_server.mcp
+            server_params: How to start the same server out of process, needed
+                when out_of_process_tools is not empty
+            out_of_process_tools: Tools that must still run in a subprocess
+            pool_size: Number of server processes for out-of-process tools
+        """
+        if out_of_process_tools and server_params is None:
+            raise ValueError(
+                f"Server '{name}' has out-of-process tools {sorted(out_of_process_tools)} "
+                "but no server_params to start them with"
+            )
+        start = time.perf_counter()
+        fallback = None
+        if out_of_process_tools:
+            fallback = ServerPool(server_params, size=pool_size or self.pool_size)
+        local = InProcessServer(server, fallback, out_of_process_tools)
+        self.servers[name] = local
+        tools = await local.list_tools()
+        self.startup_times[name] = time.perf_counter() - start
+        logging.info(f"Mounted MCP server '{name}' in process in {self.startup_times[name]:.3f}s")
+        return tools
 
     async def connect_to_server(self, server_script_path: str):
         """Connect to the MCP server and create Agent with available tools."""
         # Define the parameters for connecting to the MCP server
-        command = "D:\\source\\vscode\\agent1\\.venv\\Scripts\\python.exe"
-        server_params = StdioServerParameters(command=command, args=[server_script_path])
+        server_params = StdioServerParameters(command=sys.executable, args=[server_script_path])
 
-        # Establish communication with the MCP server
-        stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
-        self.stdio, self.write = stdio_transport
-        self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write))
-        
-        # Initialize and get available tools
-        await self.session.initialize()
-        response = await self.session.list_tools()
-        mcp_tools = response.tools
+        # Start a pool of server processes for concurrent tool calls
+        name = Path(server_script_path).stem
+        mcp_tools = await self._start_server(name, server_params, self.pool_size)
         
         # Convert MCP tools to agent tools
         tools_names = [tool.name for tool in mcp_tools]
-        print(f"\nConnected to server with tools: {tools_names}")
-        
-        agent_tools = [self._create_tool_from_mcp(tool) for tool in mcp_tools]
+        print(f"\nConnected to {self.pool_size} server process(es) with tools: {tools_names}")
         
-        self.agent.tools.extend(agent_tools)
+        self._register_tools({name: mcp_tools})
+
+    async def connect_to_servers(self, config_path: str = "servers_config.json"):
+        """Start every server listed in the config concurrently and add their tools.
+
+        Args:
+            config_path: JSON file with an "mcpServers" mapping of server name to
+                command, args, optional env, poolSize, cacheTools and toolLimits
+                ({tool: {"maxConcurrency": int, "timeout": seconds}}). A server
+                with "inProcess": "module:attribute" is mounted in this process,
+                except for the tools listed in "outOfProcessTools".
+        """
+        with open(config_path) as f:
+            config = json.load(f)
+        servers = config.get("mcpServers", {})
+        for name, spec in servers.items():
+            self._server_cache_tools[name] = set(spec.get("cacheTools", ()))
+            for tool_name, limits in spec.get("toolLimits", {}).items():
+                self.tool_limits.setdefault(
+                    tool_name,
+                    {"max_concurrency": limits.get("maxConcurrency"), "timeout": limits.get("timeout")},
+                )
+
+        async def start(name: str, spec: dict):
+            server_params = StdioServerParameters(
+                command=_resolve_command(spec["command"]),
+                args=spec.get("args", []),
+                env=spec.get("env"),
+            )
+            pool_size = spec.get("poolSize", self.pool_size)
+            if spec.get("inProcess"):
+                return await self.mount_server(
+                    name,
+                    _load_object(spec["inProcess"]),
+                    server_params,
+                    spec.get("outOfProcessTools", ()),
+                    pool_size,
+                )
+            return await self._start_server(name, server_params, pool_size)
+
+        start_time = time.perf_counter()
+        results = await asyncio.gather(
+            *(start(name, spec) for name, spec in servers.items()),
+            return_exceptions=True,
+        )
+
+        server_tools = {}
+        for name, result in zip(servers, results):
+            if isinstance(result, BaseException):
+                logging.error(f"Failed to start MCP server '{name}': {result}")
+                server = self.servers.pop(name, None)
+                if server is not None:
+                    await server.stop()
+                continue
+            server_tools[name] = result
+            print(
+                f"Connected to '{name}' in {self.startup_times[name]:.2f}s "
+                f"with tools: {[tool.name for tool in result]}"
+            )
+        print(f"Started {len(server_tools)} server(s) in {time.perf_counter() - start_time:.2f}s")
 
-    def _create_tool_from_mcp(self, mcp_tool):
-        """Create an OpenAI Agents SDK FunctionTool from an MCP tool."""
+        self._register_tools(server_tools)
+
+    def _create_tool_from_mcp(
+        self,
+        mcp_tool,
+        server: Union[ServerPool, InProcessServer],
+        name: Optional[str] = None,
+        cacheable: bool = False,
+    ):
+        """Create an OpenAI Agents SDK FunctionTool from an MCP tool.
+
+        Results of cacheable tools are kept in a per-tool LRU/TTL cache keyed
+        by the canonicalized arguments. Each tool has its own concurrency
+        limit and deadline, so a slow tool only queues behind itself, and its
+        call latencies are recorded in tool_latency. A call that misses its
+        deadline is cancelled on the client side.
+        """
         # Simplify schema handling
         params_schema = getattr(mcp_tool, "inputSchema", {})
         if isinstance(params_schema, dict):
@@ -67,28 +555,80 @@ class MCPClient:
                 "additionalProperties": False
             }
         
+        tool_name = name or mcp_tool.name
+        cache = None
+        if cacheable:
+            cache = TTLCache(max_size=self.cache_size, ttl=self.cache_ttl)
+            self.tool_caches[tool_name] = cache
+
+        limits = self.tool_limits.get(tool_name) or self.tool_limits.get(mcp_tool.name) or {}
+        max_concurrency = limits.get("max_concurrency")
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        timeout = limits.get("timeout") or self.default_tool_timeout
+        histogram = self.tool_latency[tool_name] = LatencyHistogram()
+
+        async def call_with_limits(args_dict):
+            async with semaphore or nullcontext():
+                self.tool_in_flight[tool_name] += 1
+                try:
+                    return await server.call_tool(mcp_tool.name, args_dict)
+                finally:
+                    self.tool_in_flight[tool_name] -= 1
+
         # Create tool invoker function
         async def tool_invoker(run_context, args_json):
             try:
                 args_dict = args_json if isinstance(args_json, dict) else json.loads(args_json)
-                response = await self.session.call_tool(mcp_tool.name, args_dict)
+                if cache is not None:
+                    cache_key = json.dumps(args_dict, sort_keys=True, separators=(",", ":"))
+                    cached = cache.get(cache_key)
+                    if cached is not None:
+                        return cached
+
+                start = time.perf_counter()
+                try:
+                    # The deadline covers waiting for a slot as well as the call
+                    response = await asyncio.wait_for(call_with_limits(args_dict), timeout)
+                finally:
+                    histogram.observe(time.perf_counter() - start)
                 
                 # Extract text content from response
                 if response and hasattr(response, "content"):
                     for item in response.content:
                         if getattr(item, "type", None) == "text":
+                            if cache is not None and not getattr(response, "isError", False):
+                                cache.set(cache_key, item.text)
                             return item.text
                 return "No textual response from tool"
+            except asyncio.TimeoutError:
+                return f"Error calling tool: no response within {timeout}s"
             except Exception as e:
                 return f"Error calling tool: {str(e)}"
         
+        # Strict schemas require every property to be required, so tools with
+        # optional arguments are registered as non-strict
+        properties = params_schema.get("properties", {})
+        strict = set(params_schema.get("required", [])) == set(properties)
+
         return FunctionTool(
-            name=mcp_tool.name,
+            name=tool_name,
             description=getattr(mcp_tool, "description", ""),
             params_json_schema=params_schema,
-            on_invoke_tool=tool_invoker
+            on_invoke_tool=tool_invoker,
+            strict_json_schema=strict
         )
 
+    def tool_stats(self) -> dict[str, dict]:
+        """Return latency percentiles and calls in flight for each tool."""
+        return {
+            name: {**histogram.snapshot(), "in_flight": self.tool_in_flight[name]}
+            for name, histogram in self.tool_latency.items()
+        }
+
+    def cache_stats(self) -> dict[str, dict[str, int]]:
+        """Return hit/miss counters for each cached tool."""
+        return {name: cache.stats() for name, cache in self.tool_caches.items()}
+
     async def process_query(self, query: str) -> str:
         """Process a user query using the agent."""
         if not self.agent:
@@ -111,6 +651,7 @@ class MCPClient:
 
     async def cleanup(self):
         """Clean up resources before exiting."""
+        await asyncio.gather(*(server.stop() for server in self.servers.values()))
         await self.exit_stack.aclose()
 
 async def main():
@@ -122,6 +663,18 @@ async def main():
         default="mcp_server.py", 
         help="Path to the server script"
     )
+    parser.add_argument(
+        "--pool_size",
+        type=int,
+        default=1,
+        help="Number of server processes to start"
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=None,
+        help="Path to a servers config file; starts every server it lists"
+    )
     args = parser.parse_args()
     
      # Create a new agent with the tools
@@ -139,9 +692,12 @@ async def main():
         """
     )
     
-    client = MCPClient(agent)
+    client = MCPClient(agent, pool_size=args.pool_size)
     try:
-        await client.connect_to_server(args.server_script)
+        if args.config:
+            await client.connect_to_servers(args.config)
+        else:
+            await client.connect_to_server(args.server_script)
         await client.chat_loop()
     finally:
         await client.cleanup()
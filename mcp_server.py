@@ -1,27 +1,117 @@
 # server.py
+import asyncio
+import functools
+import logging
+import os
+from typing import Optional, Union
+
 from mcp.server.fastmcp import FastMCP
-from python_repl import PythonREPL
+from mcp.types import ToolAnnotations
+from python_repl import (
+    AdmissionController,
+    ForkServerREPL,
+    REPLSessionManager,
+    REPLWorkerPool,
+    ResourceLimits,
+)
+
+logger = logging.getLogger(__name__)
 
 # Create an MCP server
 mcp = FastMCP("demo-server")
 
+# Wall-clock budget for a single execute_code call
+EXECUTE_TIMEOUT = float(os.getenv("REPL_TIMEOUT", "60"))
+
+# Limits applied to every execution
+repl_limits = ResourceLimits(
+    cpu_time=float(os.getenv("REPL_CPU_SECONDS", "30")),
+    memory_mb=int(os.getenv("REPL_MEMORY_MB", "2048")),
+    open_files=int(os.getenv("REPL_MAX_OPEN_FILES", "256")),
+)
+
+# "pool" reuses warm workers; "forkserver" forks each execution from a
+# process that has already imported REPL_PRELOAD
+REPL_MODE = os.getenv("REPL_MODE", "pool")
+REPL_PRELOAD = [m for m in os.getenv("REPL_PRELOAD", "numpy").split(",") if m]
+
+
+# The REPL pools are built on first use, so importing this module, e.g. to
+# mount it in a client process, starts no workers and touches no global state
+@functools.lru_cache(maxsize=None)
+def get_repl_admission() -> AdmissionController:
+    """Cap on executions running at once across the pool and sessions."""
+    return AdmissionController(
+        max_concurrent=int(os.getenv("REPL_MAX_CONCURRENT", str(os.cpu_count() or 1))),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_repl_pool() -> Union[REPLWorkerPool, ForkServerREPL]:
+    """REPL for execute_code calls without a session_id."""
+    if REPL_MODE == "forkserver":
+        return ForkServerREPL(
+            preload=REPL_PRELOAD,
+            max_output_size=int(os.getenv("REPL_MAX_OUTPUT", "64000")),
+            limits=repl_limits,
+            admission=get_repl_admission(),
+        )
+    # Warm REPL workers shared by all execute_code calls
+    return REPLWorkerPool(
+        pool_size=int(os.getenv("REPL_POOL_SIZE", "4")),
+        max_queue_depth=int(os.getenv("REPL_MAX_QUEUE_DEPTH", "32")),
+        max_executions_per_worker=int(os.getenv("REPL_MAX_EXECUTIONS_PER_WORKER", "100")),
+        max_output_size=int(os.getenv("REPL_MAX_OUTPUT", "64000")),
+        limits=repl_limits,
+        admission=get_repl_admission(),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_repl_sessions() -> REPLSessionManager:
+    """Stateful namespaces for execute_code calls that pass a session_id."""
+    repl_pool = get_repl_pool()
+    return REPLSessionManager(
+        max_sessions=int(os.getenv("REPL_MAX_SESSIONS", "16")),
+        idle_ttl=float(os.getenv("REPL_SESSION_TTL", "900")),
+        memory_limit_mb=int(os.getenv("REPL_SESSION_MEMORY_MB", "512")),
+        max_output_size=int(os.getenv("REPL_MAX_OUTPUT", "64000")),
+        limits=repl_limits,
+        admission=get_repl_admission(),
+        # New sessions fork from the preloaded server too
+        fork_server=repl_pool.fork_server if isinstance(repl_pool, ForkServerREPL) else None,
+    )
+
 @mcp.tool()
-def execute_code(code: str) -> str:
+async def execute_code(code: str, session_id: Optional[str] = None) -> str:
     """
     Execute the code and return the output.
     Perform any calculations
     Args:
         code: The code to execute
+        session_id: Optional session to run in. Variables and imports are kept
+            between calls that pass the same session_id
     Returns:
         str: The output of the code
     """
     print(f"Executing code on the server: {code}")
-    python_repl = PythonREPL()
-    result =python_repl.run(code)
-    return result
+    if session_id:
+        result = await asyncio.to_thread(
+            get_repl_sessions().execute, session_id, code, EXECUTE_TIMEOUT
+        )
+    else:
+        result = await asyncio.to_thread(get_repl_pool().execute, code, EXECUTE_TIMEOUT)
+    logger.info(
+        "execute_code %s: wall %.3fs, cpu %s s, peak rss %s bytes",
+        result.status,
+        result.wall_time,
+        result.cpu_time,
+        result.peak_rss,
+    )
+    return result.output
 
-# Add an addition tool
-@mcp.tool()
+# Add an addition tool. It is pure, so clients may cache its results.
+@mcp.tool(annotations=ToolAnnotations(readOnlyHint=True, idempotentHint=True, openWorldHint=False))
 def add(a: int, b: int) -> int:
     """
     Add two numbers
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Optional
+
+from agents import Agent, Runner
+
+if TYPE_CHECKING:
+    from agent import Plan, Task
+
+logger = logging.getLogger(__name__)
+
+# Order in which agents' work normally flows. When a task does not list its
+# dependencies, it depends on every earlier task assigned to an earlier stage.
+AGENT_STAGES = {
+    "researcher": 0,
+    "developer": 1,
+    "tester": 2,
+}
+
+
+@dataclass
+class TaskResult:
+    id: str
+    agent: str
+    task: str
+    status: str = "pending"  # ok, error or skipped
+    output: str = ""
+    wall_time: float = 0.0
+
+
+@dataclass
+class PlanResult:
+    goal: str
+    results: dict[str, TaskResult] = field(default_factory=dict)
+    wall_time: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return all(result.status == "ok" for result in self.results.values())
+
+    def merged_output(self) -> str:
+        """Combine every task's output, in plan order, into one report."""
+        sections = [f"Goal: {self.goal}"]
+        for result in self.results.values():
+            sections.append(f"## {result.id} ({result.agent}, {result.status})\n{result.output}")
+        return "\n\n".join(sections)
+
+
+def resolve_dependencies(tasks: list["Task"]) -> dict[str, list[str]]:
+    """Return the dependency ids of each task, keyed by task id.
+
+    Tasks without an id are numbered task1, task2, ... in plan order. Explicit
+    depends_on lists are used as given; otherwise dependencies are inferred
+    from AGENT_STAGES, and tasks for unknown agents wait for every earlier task.
+
+    Raises:
+        ValueError: If a dependency is unknown, ids repeat, or the graph has a cycle
+    """
+    ids = [task.id or f"task{index}" for index, task in enumerate(tasks, 1)]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Duplicate task ids in plan: {ids}")
+
+    dependencies: dict[str, list[str]] = {}
+    for index, (task_id, task) in enumerate(zip(ids, tasks)):
+        if task.depends_on is not None:
+            unknown = set(task.depends_on) - set(ids)
+            if unknown:
+                raise ValueError(f"Task {task_id} depends on unknown tasks: {sorted(unknown)}")
+            dependencies[task_id] = list(task.depends_on)
+            continue
+        stage = AGENT_STAGES.get(task.agent.lower())
+        dependencies[task_id] = [
+            ids[earlier]
+            for earlier in range(index)
+            if stage is None
+            or AGENT_STAGES.get(tasks[earlier].agent.lower(), stage) < stage
+        ]
+
+    # Kahn's algorithm, only to reject cycles before anything runs
+    remaining = {task_id: set(deps) for task_id, deps in dependencies.items()}
+    while remaining:
+        ready = [task_id for task_id, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Dependency cycle between tasks: {sorted(remaining)}")
+        for task_id in ready:
+            del remaining[task_id]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return dependencies
+
+
+class PlanExecutor:
+    """Runs a Plan's tasks on their agents as a dependency graph.
+
+    Each task starts as soon as the tasks it depends on have finished, so
+    independent tasks run concurrently and a plan takes roughly the time of
+    its longest dependency chain. A task receives its dependencies' outputs
+    in its prompt. If a dependency fails, the task is skipped.
+    """
+
+    def __init__(self, agents: dict[str, Agent], max_concurrency: int = 4, max_turns: int = 10):
+        """
+        Args:
+            agents: Agents that can be assigned tasks, by name (case-insensitive)
+            max_concurrency: Maximum number of tasks running at once across the plan
+            max_turns: Maximum turns for each task's agent run
+        """
+        self.agents = {name.lower(): agent for name, agent in agents.items()}
+        self.max_concurrency = max_concurrency
+        self.max_turns = max_turns
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def _prompt(self, goal: str, task: "Task", inputs: list[TaskResult]) -> str:
+        prompt = f"Overall goal: {goal}\n\nYour task: {task.task}"
+        for result in inputs:
+            prompt += f"\n\nResult of {result.id} ({result.agent}):\n{result.output}"
+        return prompt
+
+    async def _run_task(
+        self,
+        goal: str,
+        task: "Task",
+        result: TaskResult,
+        inputs: list[TaskResult],
+        waits: list[asyncio.Task],
+    ):
+        await asyncio.gather(*waits, return_exceptions=True)
+        failed = [dep.id for dep in inputs if dep.status != "ok"]
+        if failed:
+            result.status = "skipped"
+            result.output = f"Skipped because {', '.join(failed)} did not succeed"
+            return
+
+        agent = self.agents.get(task.agent.lower())
+        if agent is None:
+            result.status = "error"
+            result.output = f"Unknown agent: {task.agent}"
+            return
+
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                run = await Runner.run(
+                    agent, self._prompt(goal, task, inputs), max_turns=self.max_turns
+                )
+                result.output = str(run.final_output)
+                result.status = "ok"
+            except Exception as e:
+                logger.warning(f"Task {result.id} on {task.agent} failed: {e}")
+                result.output = str(e)
+                result.status = "error"
+            finally:
+                result.wall_time = time.perf_counter() - started
+
+    async def execute(self, plan: "Plan") -> PlanResult:
+        """Run every task in the plan and return their results in plan order.
+
+        Raises:
+            ValueError: If the plan's dependencies are invalid
+        """
+        dependencies = resolve_dependencies(plan.tasks)
+        plan_result = PlanResult(goal=plan.goal)
+        for task_id, task in zip(dependencies, plan.tasks):
+            plan_result.results[task_id] = TaskResult(id=task_id, agent=task.agent, task=task.task)
+
+        # Plan order is a topological order only for inferred dependencies, so
+        # create every result first and let each task wait on its own inputs
+        started = time.perf_counter()
+        runners: dict[str, asyncio.Task] = {}
+        pending = list(zip(dependencies, plan.tasks))
+        while pending:
+            for task_id, task in list(pending):
+                if all(dep in runners for dep in dependencies[task_id]):
+                    runners[task_id] = asyncio.create_task(
+                        self._run_task(
+                            plan.goal,
+                            task,
+                            plan_result.results[task_id],
+                            [plan_result.results[dep] for dep in dependencies[task_id]],
+                            [runners[dep] for dep in dependencies[task_id]],
+                        )
+                    )
+                    pending.remove((task_id, task))
+        try:
+            await asyncio.gather(*runners.values())
+        finally:
+            for runner in runners.values():
+                runner.cancel()
+        plan_result.wall_time = time.perf_counter() - started
+
+        task_time = sum(result.wall_time for result in plan_result.results.values())
+        logger.info(
+            f"Plan finished in {plan_result.wall_time:.1f}s "
+            f"({task_time:.1f}s of agent time across {len(runners)} tasks)"
+        )
+        return plan_result
+
+
+async def plan_and_execute(
+    planner: Agent, executor: PlanExecutor, request: str, max_turns: Optional[int] = None
+) -> PlanResult:
+    """Ask the planner for a Plan and execute it.
+
+    Args:
+        planner: Agent whose output_type is Plan
+        executor: Executor for the plan's tasks
+        request: What the user wants done
+        max_turns: Maximum turns for the planner
+    """
+    run = await Runner.run(planner, request, max_turns=max_turns or executor.max_turns)
+    return await executor.execute(run.final_output)
@@ -1,13 +1,32 @@
+import asyncio
+import atexit
+import contextlib
 import functools
+import io
 import logging
+import math
 import multiprocessing
+import os
+import queue
 import re
+import signal
+import socket
 import sys
+import threading
+import time
+from collections import OrderedDict
 from io import StringIO
-from typing import Dict, Optional
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 from pydantic import BaseModel, Field
 
+from repl_forkserver import ForkServer
+
 logger = logging.getLogger(__name__)
 
 
@@ -35,24 +54,39 @@ class PythonREPL(BaseModel):
         return text.strip()
 
     @classmethod
-    def worker(
+    def execute(
         cls,
         command: str,
         globals: Optional[Dict],
         locals: Optional[Dict],
-        queue: multiprocessing.Queue,
-    ) -> None:
+        stdout: Optional[TextIO] = None,
+    ) -> str:
+        """Execute command in the given namespace and return anything printed.
+
+        If stdout is given, printed output is written there instead and only
+        the exception repr, if any, is returned.
+        """
         old_stdout = sys.stdout
-        sys.stdout = mystdout = StringIO()
+        sys.stdout = mystdout = stdout if stdout is not None else StringIO()
         try:
             # Extract Python code from markdown blocks if present
             extracted_command = cls.extract_python_code(command)
             exec(extracted_command, globals, locals)
             sys.stdout = old_stdout
-            queue.put(mystdout.getvalue())
+            return "" if stdout is not None else mystdout.getvalue()
         except Exception as e:
             sys.stdout = old_stdout
-            queue.put(repr(e))
+            return repr(e)
+
+    @classmethod
+    def worker(
+        cls,
+        command: str,
+        globals: Optional[Dict],
+        locals: Optional[Dict],
+        queue: multiprocessing.Queue,
+    ) -> None:
+        queue.put(cls.execute(command, globals, locals))
 
 
     def run(self, command: str, timeout: Optional[int] = None) -> str:
@@ -84,3 +118,1076 @@ class PythonREPL(BaseModel):
         # get the result from the worker function
         return queue.get()
 
+
+class ResourceLimits(BaseModel):
+    """Per-execution resource limits applied inside a REPL worker.
+
+    Limits are enforced with setrlimit and are ignored on platforms without
+    the resource module. The CPU limit has one-second granularity.
+    """
+
+    cpu_time: Optional[float] = Field(default=None, description="CPU seconds per execution")
+    memory_mb: Optional[int] = Field(default=None, description="Address space limit in MB")
+    open_files: Optional[int] = Field(default=None, description="Maximum open file descriptors")
+
+
+class ExecutionResult(BaseModel):
+    """Output and resource accounting of one execution."""
+
+    output: str
+    status: str = Field(
+        default="ok",
+        description="ok, error, cpu_limit, timeout, crashed or rejected",
+    )
+    wall_time: float = 0.0
+    cpu_time: Optional[float] = None
+    peak_rss: Optional[int] = None
+
+
+class AdmissionController:
+    """Caps how many executions run at once across pools and sessions.
+
+    Callers beyond max_concurrent wait their turn; once max_waiting callers
+    are already queued, or a caller waits longer than wait_timeout, the
+    execution is rejected instead.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_waiting: int = 64,
+        wait_timeout: Optional[float] = None,
+    ) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._cond = threading.Condition()
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    @contextlib.contextmanager
+    def admit(self) -> Iterator[bool]:
+        """Context manager yielding True while admitted, or False if rejected."""
+        with self._cond:
+            admitted = self.waiting < self.max_waiting
+            if admitted:
+                self.waiting += 1
+                admitted = self._cond.wait_for(
+                    lambda: self.running < self.max_concurrent, self.wait_timeout
+                )
+                self.waiting -= 1
+            if admitted:
+                self.running += 1
+            else:
+                self.rejected += 1
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                with self._cond:
+                    self.running -= 1
+                    self._cond.notify()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "running": self.running,
+                "waiting": self.waiting,
+                "rejected": self.rejected,
+            }
+
+
+def _admit(admission: Optional[AdmissionController]):
+    return admission.admit() if admission is not None else contextlib.nullcontext(True)
+
+
+def _current_rss() -> Optional[int]:
+    """Return the resident set size of this process in bytes, if known."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+    return None
+
+
+class _PipeWriter(io.TextIOBase):
+    """stdout replacement that forwards printed text to the parent in chunks.
+
+    Text is sent once chunk_size characters are buffered, and a background
+    thread flushes anything older than flush_interval so slow snippets still
+    stream, without growing the worker's memory. Only the first head_size
+    characters of an execution are streamed; past that just the last
+    tail_size are kept and sent when it ends, so a chatty snippet can't
+    flood the pipe. Text written outside an execution, e.g. by a thread
+    left running, is discarded.
+    """
+
+    def __init__(self, conn, chunk_size: int = 8192, flush_interval: float = 0.1) -> None:
+        self._conn = conn
+        self._chunk_size = chunk_size
+        self._buffer: List[str] = []
+        self._size = 0
+        self._active = False
+        self._head_left = 0
+        self._tail_size = 0
+        self._tail = ""
+        self._omitted = 0
+        # CPU seconds used by the flusher thread, left out of execution accounting
+        self.cpu_time = 0.0
+        self._lock = threading.Lock()
+        self._flusher = threading.Thread(
+            target=self._flush_loop, args=(flush_interval,), daemon=True
+        )
+        self._flusher.start()
+
+    def writable(self) -> bool:
+        return True
+
+    def begin(self, head_size: int, tail_size: int) -> None:
+        """Start capturing an execution's output."""
+        with self._lock:
+            self._active = True
+            self._head_left = head_size
+            self._tail_size = tail_size
+            self._tail = ""
+            self._omitted = 0
+
+    def write(self, text: str) -> int:
+        with self._lock:
+            if not self._active:
+                return len(text)
+            head = text[: self._head_left]
+            if head:
+                self._head_left -= len(head)
+                self._buffer.append(head)
+                self._size += len(head)
+                if self._size >= self._chunk_size:
+                    self._flush_locked()
+            rest = text[len(head) :]
+            if rest:
+                self._omitted += len(rest)
+                if self._tail_size:
+                    self._tail = (self._tail + rest[-self._tail_size :])[-self._tail_size :]
+        return len(text)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._buffer:
+            return
+        text = "".join(self._buffer)
+        self._buffer.clear()
+        self._size = 0
+        for i in range(0, len(text), self._chunk_size):
+            self._conn.send(("out", text[i : i + self._chunk_size]))
+
+    def _flush_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except (BrokenPipeError, OSError):
+                return
+            self.cpu_time = time.thread_time()
+
+    def end(self, message: Tuple) -> None:
+        """Send the rest of the execution's output, then a control message."""
+        with self._lock:
+            self._flush_locked()
+            if self._omitted:
+                self._omitted -= len(self._tail)
+                if self._omitted:
+                    self._conn.send(("omitted", self._omitted))
+                if self._tail:
+                    self._conn.send(("out", self._tail))
+            self._active = False
+            self._tail = ""
+            self._conn.send(message)
+
+
+def _reset_peak_rss() -> None:
+    """Reset the kernel's peak RSS counter for this process (Linux only)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss() -> Optional[int]:
+    """Return the peak resident set size of this process in bytes, if known."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    if resource is not None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+    return None
+
+
+class _CPUTimeExceeded(BaseException):
+    """Raised in a worker when an execution uses up its CPU time limit.
+
+    Derives from BaseException so snippets catching Exception can't swallow it.
+    """
+
+
+class _CPUGuard:
+    """Turns SIGXCPU into _CPUTimeExceeded while an execution runs.
+
+    RLIMIT_CPU counts the whole process, including the output flusher
+    thread, so the handler only raises once the execution itself has used
+    its budget and otherwise extends the soft limit. It raises at most once
+    per execution and ignores the signal outside one, so a late signal
+    can't kill the worker while it restores limits or sends the reply.
+    """
+
+    def __init__(self, writer: "_PipeWriter") -> None:
+        self._writer = writer
+        self._armed = False
+        self._limit: Optional[float] = None
+        self._start = 0.0
+        self._writer_start = 0.0
+
+    def arm(self, limit: Optional[float]) -> None:
+        self._limit = limit
+        self._start = time.process_time()
+        self._writer_start = self._writer.cpu_time
+        self._armed = limit is not None
+
+    def disarm(self) -> None:
+        self._armed = False
+
+    def used(self) -> float:
+        """CPU seconds used by the execution so far, not counting the flusher."""
+        return time.process_time() - self._start - (self._writer.cpu_time - self._writer_start)
+
+    def handle(self, signum, frame) -> None:
+        if not self._armed:
+            return
+        remaining = self._limit - self.used()
+        if remaining > 0:
+            soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            value = math.ceil(time.process_time() + remaining)
+            if hard == resource.RLIM_INFINITY or value <= hard:
+                resource.setrlimit(resource.RLIMIT_CPU, (value, hard))
+                return
+        self._armed = False
+        raise _CPUTimeExceeded()
+
+
+def _apply_limits(limits: Optional[ResourceLimits]) -> Dict[int, Tuple[int, int]]:
+    """Lower the soft rlimits for one execution and return the previous values.
+
+    Only soft limits are changed so a reused worker can restore them after
+    the execution.
+    """
+    saved: Dict[int, Tuple[int, int]] = {}
+    if resource is None or limits is None:
+        return saved
+
+    def lower(which: int, value: int) -> None:
+        soft, hard = resource.getrlimit(which)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        try:
+            resource.setrlimit(which, (value, hard))
+            saved[which] = (soft, hard)
+        except (ValueError, OSError) as e:
+            logger.warning("Could not set resource limit %s: %s", which, e)
+
+    if limits.cpu_time is not None:
+        # RLIMIT_CPU counts the process's total CPU time, so extend from now
+        lower(resource.RLIMIT_CPU, math.ceil(time.process_time() + limits.cpu_time))
+    if limits.memory_mb is not None:
+        lower(resource.RLIMIT_AS, limits.memory_mb * 1024 * 1024)
+    if limits.open_files is not None:
+        lower(resource.RLIMIT_NOFILE, limits.open_files)
+    return saved
+
+
+def _restore_limits(saved: Dict[int, Tuple[int, int]]) -> None:
+    for which, value in saved.items():
+        resource.setrlimit(which, value)
+
+
+def _pool_worker_main(conn, persistent: bool = False) -> None:
+    """Serve commands sent by a REPLWorkerPool until the pipe closes.
+
+    Unless persistent is set, every command runs in a fresh namespace, so a
+    reused worker behaves like a new PythonREPL() from the caller's point of
+    view. Each request is (command, limits, (head_size, tail_size)). Output
+    is streamed as ("out", text) messages, with ("omitted", count) standing
+    in for the middle of output longer than head_size + tail_size, and each
+    command ends with ("done", usage) carrying the status, CPU time and
+    memory use of the execution.
+    """
+    # Threads a snippet leaves running print here too, never to the
+    # inherited stdout
+    sys.stdout = stdout = _PipeWriter(conn)
+    cpu_guard = _CPUGuard(stdout)
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, cpu_guard.handle)
+    namespace: Dict = {}
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message is None:
+            break
+        command, limits, (head_size, tail_size) = message
+        stdout.begin(head_size, tail_size)
+        if not persistent:
+            namespace = {}
+
+        _reset_peak_rss()
+        saved = _apply_limits(limits)
+        cpu_guard.arm(limits.cpu_time if limits is not None else None)
+        status = "ok"
+        try:
+            error = PythonREPL.execute(command, namespace, None, stdout=stdout)
+            cpu_guard.disarm()
+            if error:
+                status = "error"
+        except _CPUTimeExceeded:
+            error = "CPU time limit exceeded"
+            status = "cpu_limit"
+        finally:
+            cpu_guard.disarm()
+            _restore_limits(saved)
+        if error:
+            stdout.write(error)
+        stdout.end(
+            (
+                "done",
+                {
+                    "status": status,
+                    "cpu_time": cpu_guard.used(),
+                    "peak_rss": _peak_rss(),
+                    "rss": _current_rss(),
+                },
+            )
+        )
+
+
+class OutputSpool:
+    """Bounded capture of a command's output.
+
+    Only the start of the output and its last tail_size characters are
+    kept. The text handed back is the start plus, when the output was too
+    long, a truncation marker and the tail, so memory and token use stay
+    flat however much a command prints. REPL workers apply the same bound
+    before sending, and report what they left out through omit().
+    """
+
+    def __init__(
+        self,
+        max_size: int = 64_000,
+        tail_size: Optional[int] = None,
+        on_output: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        """
+        Args:
+            max_size: Characters returned before the output is truncated
+            tail_size: Characters kept from the end of truncated output,
+                defaults to a quarter of max_size
+            on_output: Called with each piece of visible text as it arrives
+        """
+        self.max_size = max_size
+        self.tail_size = max_size // 4 if tail_size is None else min(tail_size, max_size)
+        self.head_size = max_size - self.tail_size
+        self._on_output = on_output
+        self._head = ""
+        self._tail = ""
+        self.size = 0
+
+    @property
+    def truncated(self) -> bool:
+        return self.size > self.max_size
+
+    def write(self, text: str) -> None:
+        self.size += len(text)
+        visible = ""
+        if len(self._head) < self.head_size:
+            visible = text[: self.head_size - len(self._head)]
+            self._head += visible
+        if self.tail_size:
+            self._tail = (self._tail + text[-self.tail_size :])[-self.tail_size :]
+        if visible and self._on_output is not None:
+            self._on_output(visible)
+
+    def omit(self, count: int) -> None:
+        """Account for count characters dropped from the middle of the output."""
+        self.size += count
+
+    def _trailer(self) -> str:
+        remainder = self.size - len(self._head)
+        if remainder <= 0:
+            return ""
+        if not self.truncated:
+            return self._tail[-remainder:]
+        omitted = remainder - len(self._tail)
+        return f"\n... [{omitted} characters truncated] ...\n{self._tail}"
+
+    def finish(self, note: str = "") -> str:
+        """Return the visible output, followed by note if one is given."""
+        trailer = self._trailer()
+        if note:
+            if (self._head or trailer) and not (self._head + trailer).endswith("\n"):
+                trailer += "\n"
+            trailer += note
+        if trailer and self._on_output is not None:
+            self._on_output(trailer)
+        return self._head + trailer
+
+    def close(self) -> None:
+        self._head = self._tail = ""
+
+
+async def _stream_from_thread(run: Callable[..., str], *args) -> AsyncIterator[str]:
+    """Call run(*args, on_output=...) in a thread and yield its output pieces."""
+    loop = asyncio.get_running_loop()
+    chunks: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+
+    def on_output(text: str) -> None:
+        loop.call_soon_threadsafe(chunks.put_nowait, text)
+
+    future = loop.run_in_executor(None, functools.partial(run, *args, on_output=on_output))
+    future.add_done_callback(lambda _: chunks.put_nowait(None))
+    while True:
+        chunk = await chunks.get()
+        if chunk is None:
+            break
+        yield chunk
+    await future
+
+
+class _PoolWorker:
+    """A REPL worker process and the parent end of its pipe."""
+
+    def __init__(self, ctx, persistent: bool = False) -> None:
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_pool_worker_main, args=(child_conn, persistent), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.executions = 0
+
+    def request(
+        self,
+        command: str,
+        limits: Optional[ResourceLimits],
+        timeout: Optional[float],
+        spool: OutputSpool,
+    ) -> Dict[str, Any]:
+        """Send command and read its output into spool.
+
+        Returns:
+            The usage reported by the worker plus wall_time. status is
+            "timeout" or "crashed" when the worker did not finish.
+        """
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        usage: Dict[str, Any] = {"status": "crashed"}
+        try:
+            self.conn.send((command, limits, (spool.head_size, spool.tail_size)))
+            while True:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                if not self.conn.poll(remaining):
+                    usage = {"status": "timeout"}
+                    break
+                kind, payload = self.conn.recv()
+                if kind == "out":
+                    spool.write(payload)
+                elif kind == "omitted":
+                    spool.omit(payload)
+                else:
+                    usage = payload
+                    break
+        except (BrokenPipeError, EOFError, OSError):
+            pass
+        usage["wall_time"] = time.monotonic() - start
+        return usage
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def close(self, timeout: float = 1.0) -> None:
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout)
+        self.kill()
+
+
+class REPLWorkerPool:
+    """A pool of warm PythonREPL worker processes reused across calls.
+
+    Workers are started once and fed commands over a pipe, so a call only
+    pays for the execution itself instead of interpreter start-up. A worker
+    is replaced after ``max_executions_per_worker`` runs, when it crashes,
+    or when a command exceeds its timeout.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 4,
+        max_queue_depth: int = 32,
+        max_executions_per_worker: int = 100,
+        max_output_size: int = 64_000,
+        limits: Optional[ResourceLimits] = None,
+        admission: Optional[AdmissionController] = None,
+        start_method: Optional[str] = None,
+    ) -> None:
+        """
+        Args:
+            pool_size: Number of worker processes kept running
+            max_queue_depth: Calls allowed to wait for a free worker before
+                new calls are rejected
+            max_executions_per_worker: Executions after which a worker is recycled
+            max_output_size: Characters of output returned before truncation
+            limits: Default resource limits for each execution
+            admission: Shared cap on concurrently running executions
+            start_method: multiprocessing start method, defaults to the platform default
+        """
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self.pool_size = pool_size
+        self.max_queue_depth = max_queue_depth
+        self.max_executions_per_worker = max_executions_per_worker
+        self.max_output_size = max_output_size
+        self.limits = limits
+        self.admission = admission
+        self._ctx = multiprocessing.get_context(start_method)
+        self._idle: "queue.Queue[_PoolWorker]" = queue.Queue()
+        self._workers: List[_PoolWorker] = []
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._started = False
+        self._closed = False
+        self.recycled = 0
+
+    def start(self) -> None:
+        """Start the worker processes. Called lazily by run()."""
+        with self._lock:
+            if self._started:
+                return
+            if self._closed:
+                raise RuntimeError("REPLWorkerPool has been shut down")
+            for _ in range(self.pool_size):
+                self._add_worker()
+            self._started = True
+        atexit.register(self.shutdown)
+
+    def _add_worker(self) -> None:
+        worker = _PoolWorker(self._ctx)
+        self._workers.append(worker)
+        self._idle.put(worker)
+
+    def _replace(self, worker: _PoolWorker) -> None:
+        worker.kill()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            self.recycled += 1
+            if not self._closed:
+                self._add_worker()
+
+    def _release(self, worker: _PoolWorker) -> None:
+        if worker.executions >= self.max_executions_per_worker:
+            self._replace(worker)
+        else:
+            self._idle.put(worker)
+
+    def _checkout(self) -> _PoolWorker:
+        worker = self._idle.get()
+        while not worker.process.is_alive():
+            # The worker died while idle; replace it and use a fresh one.
+            self._replace(worker)
+            worker = self._idle.get()
+        return worker
+
+    def execute(
+        self,
+        command: str,
+        timeout: Optional[float] = None,
+        limits: Optional[ResourceLimits] = None,
+        on_output: Optional[Callable[[str], None]] = None,
+    ) -> ExecutionResult:
+        """Run command on a pooled worker and return its output and resource use.
+
+        Args:
+            command: The code to execute
+            timeout: Seconds to wait before the worker is killed and replaced
+            limits: Resource limits for this execution, defaults to the pool's
+            on_output: Called with output pieces as they are produced
+
+        Returns:
+            ExecutionResult: The captured output, status and accounting
+        """
+        self.start()
+        spool = OutputSpool(self.max_output_size, on_output=on_output)
+        try:
+            with self._lock:
+                if self._pending >= self.pool_size + self.max_queue_depth:
+                    return ExecutionResult(
+                        output=spool.finish("Execution queue is full"), status="rejected"
+                    )
+                self._pending += 1
+            try:
+                with _admit(self.admission) as admitted:
+                    if not admitted:
+                        return ExecutionResult(
+                            output=spool.finish("Execution rejected: too many running executions"),
+                            status="rejected",
+                        )
+                    worker = self._checkout()
+                    worker.executions += 1
+                    usage = worker.request(command, limits or self.limits, timeout, spool)
+                    usage.pop("rss", None)
+                    note = ""
+                    if usage["status"] == "timeout":
+                        self._replace(worker)
+                        note = "Execution timed out"
+                    elif usage["status"] == "crashed":
+                        logger.warning("REPL worker %s exited unexpectedly", worker.process.pid)
+                        self._replace(worker)
+                        note = "Execution failed: worker process exited"
+                    else:
+                        self._release(worker)
+                    return ExecutionResult(output=spool.finish(note), **usage)
+            finally:
+                with self._lock:
+                    self._pending -= 1
+        finally:
+            spool.close()
+
+    def run(
+        self,
+        command: str,
+        timeout: Optional[float] = None,
+        on_output: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        """Run command on a pooled worker and return anything printed.
+
+        Args:
+            command: The code to execute
+            timeout: Seconds to wait before the worker is killed and replaced
+            on_output: Called with output pieces as they are produced
+
+        Returns:
+            str: The captured output, the exception repr, or a status message
+        """
+        return self.execute(command, timeout, on_output=on_output).output
+
+    def stream(self, command: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Run command on a pooled worker, yielding output as it is produced.
+
+        The chunks add up to the same bounded text run() would return.
+        """
+        return _stream_from_thread(self.run, command, timeout)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the pool size, idle workers, pending calls and recycle count."""
+        with self._lock:
+            return {
+                "pool_size": self.pool_size,
+                "idle": self._idle.qsize(),
+                "pending": self._pending,
+                "recycled": self.recycled,
+            }
+
+    def shutdown(self) -> None:
+        """Stop all worker processes."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.close()
+
+
+class _Session:
+    def __init__(self) -> None:
+        # Started on first use under the session's own lock, so a slow
+        # spawn doesn't hold up other sessions
+        self.worker: Optional[_PoolWorker] = None
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.closed = False
+
+
+class REPLSessionManager:
+    """Long-lived REPL namespaces keyed by session id.
+
+    Each session owns a dedicated worker process whose namespace survives
+    between calls, so imports and loaded data are reused. Sessions are
+    evicted least-recently-used first once ``max_sessions`` is reached, after
+    ``idle_ttl`` seconds without a call, or when the worker grows past
+    ``memory_limit_mb``.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 16,
+        idle_ttl: float = 900.0,
+        memory_limit_mb: Optional[int] = 512,
+        max_output_size: int = 64_000,
+        limits: Optional[ResourceLimits] = None,
+        admission: Optional[AdmissionController] = None,
+        start_method: Optional[str] = None,
+        fork_server: Optional[ForkServer] = None,
+    ) -> None:
+        """
+        Args:
+            max_sessions: Maximum number of live sessions
+            idle_ttl: Seconds a session may stay idle before it is evicted
+            memory_limit_mb: Resident memory above which a session is reset,
+                or None for no cap
+            max_output_size: Characters of output returned before truncation
+            limits: Default resource limits for each execution
+            admission: Shared cap on concurrently running executions
+            start_method: multiprocessing start method, defaults to the platform default
+            fork_server: Fork server to start session workers from instead, e.g.
+                ForkServerREPL.fork_server
+        """
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.memory_limit_mb = memory_limit_mb
+        self.max_output_size = max_output_size
+        self.limits = limits
+        self.admission = admission
+        self._ctx = fork_server or multiprocessing.get_context(start_method)
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._reaper: Optional[threading.Thread] = None
+        self.evictions = 0
+
+    def _start_reaper(self) -> None:
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+            self._reaper.start()
+            atexit.register(self.shutdown)
+
+    def _reap_loop(self) -> None:
+        interval = max(1.0, min(self.idle_ttl / 4, 60.0))
+        while not self._closed.wait(interval):
+            self.evict_expired()
+
+    def _acquire(self, session_id: str) -> _Session:
+        evicted = []
+        with self._lock:
+            if self._closed.is_set():
+                raise RuntimeError("REPLSessionManager has been shut down")
+            self._start_reaper()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+            else:
+                while len(self._sessions) >= self.max_sessions:
+                    _, oldest = self._sessions.popitem(last=False)
+                    evicted.append(oldest)
+                session = _Session()
+                self._sessions[session_id] = session
+            session.last_used = time.monotonic()
+        for old in evicted:
+            self._kill(old)
+        return session
+
+    def _kill(self, session: _Session) -> None:
+        # Waits for any call still running in the session before killing it.
+        with session.lock:
+            session.closed = True
+            if session.worker is not None:
+                session.worker.kill()
+        self.evictions += 1
+
+    def _drop(self, session_id: str, session: _Session) -> None:
+        # Called with session.lock held.
+        with self._lock:
+            if self._sessions.get(session_id) is session:
+                del self._sessions[session_id]
+        session.closed = True
+        if session.worker is not None:
+            session.worker.kill()
+        self.evictions += 1
+
+    def execute(
+        self,
+        session_id: str,
+        command: str,
+        timeout: Optional[float] = None,
+        limits: Optional[ResourceLimits] = None,
+        on_output: Optional[Callable[[str], None]] = None,
+    ) -> ExecutionResult:
+        """Run command in the namespace of session_id and return its output and resource use.
+
+        Args:
+            session_id: Identifier of the session, created on first use
+            command: The code to execute
+            timeout: Seconds to wait before the session is killed
+            limits: Resource limits for this execution, defaults to the manager's
+            on_output: Called with output pieces as they are produced
+
+        Returns:
+            ExecutionResult: The captured output, status and accounting
+        """
+        spool = OutputSpool(self.max_output_size, on_output=on_output)
+        try:
+            while True:
+                session = self._acquire(session_id)
+                # Queue on the session first so waiting callers don't hold admission slots
+                with session.lock:
+                    if session.closed:
+                        # Evicted while we were waiting for the lock; start over.
+                        continue
+                    if session.worker is None:
+                        session.worker = _PoolWorker(self._ctx, persistent=True)
+                    with _admit(self.admission) as admitted:
+                        if not admitted:
+                            return ExecutionResult(
+                                output=spool.finish("Execution rejected: too many running executions"),
+                                status="rejected",
+                            )
+                        usage = session.worker.request(
+                            command, limits or self.limits, timeout, spool
+                        )
+                        rss = usage.pop("rss", None)
+                        note = ""
+                        if usage["status"] == "timeout":
+                            self._drop(session_id, session)
+                            note = "Execution timed out, session reset"
+                        elif usage["status"] == "crashed":
+                            self._drop(session_id, session)
+                            note = "Execution failed: session worker exited, session reset"
+                        elif (
+                            self.memory_limit_mb is not None
+                            and rss is not None
+                            and rss > self.memory_limit_mb * 1024 * 1024
+                        ):
+                            logger.info(
+                                "Resetting REPL session %s using %d MB",
+                                session_id,
+                                rss // (1024 * 1024),
+                            )
+                            self._drop(session_id, session)
+                            note = f"[session reset: memory use exceeded {self.memory_limit_mb} MB]"
+                        else:
+                            session.last_used = time.monotonic()
+                        return ExecutionResult(output=spool.finish(note), **usage)
+        finally:
+            spool.close()
+
+    def run(
+        self,
+        session_id: str,
+        command: str,
+        timeout: Optional[float] = None,
+        on_output: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        """Run command in the namespace of session_id and return anything printed.
+
+        Args:
+            session_id: Identifier of the session, created on first use
+            command: The code to execute
+            timeout: Seconds to wait before the session is killed
+            on_output: Called with output pieces as they are produced
+
+        Returns:
+            str: The captured output, the exception repr, or a status message
+        """
+        return self.execute(session_id, command, timeout, on_output=on_output).output
+
+    def stream(
+        self, session_id: str, command: str, timeout: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """Run command in session_id, yielding output as it is produced."""
+        return _stream_from_thread(self.run, session_id, command, timeout)
+
+    def close_session(self, session_id: str) -> bool:
+        """Close a session and free its worker. Returns False if it did not exist."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self._kill(session)
+        return True
+
+    def evict_expired(self) -> int:
+        """Evict sessions idle for longer than idle_ttl and return how many."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                (sid, s)
+                for sid, s in self._sessions.items()
+                if now - s.last_used > self.idle_ttl and not s.lock.locked()
+            ]
+            for sid, _ in expired:
+                del self._sessions[sid]
+        for _, session in expired:
+            self._kill(session)
+        return len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of live sessions and evictions so far."""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "evictions": self.evictions,
+            }
+
+    def shutdown(self) -> None:
+        """Close every session and stop the reaper thread."""
+        self._closed.set()
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            if session.worker is not None:
+                session.worker.close()
+
+
+class ForkServerREPL:
+    """Runs each command in a fresh process forked from a preloaded server.
+
+    The fork server imports ``preload`` once; every execution is then a
+    copy-on-write fork of it, so snippets importing heavy modules such as
+    numpy start in roughly the time of a fork while staying isolated from
+    each other. Children don't re-run the parent's __main__ module, see
+    repl_forkserver. Falls back to the default start method, without
+    preloading, where fork or pidfds are unavailable.
+    """
+
+    def __init__(
+        self,
+        preload: Optional[List[str]] = None,
+        max_output_size: int = 64_000,
+        limits: Optional[ResourceLimits] = None,
+        admission: Optional[AdmissionController] = None,
+    ) -> None:
+        """
+        Args:
+            preload: Modules the fork server imports once, e.g. ["numpy", "pandas"]
+            max_output_size: Characters of output returned before truncation
+            limits: Default resource limits for each execution
+            admission: Shared cap on concurrently running executions
+        """
+        self.preload = list(preload or [])
+        self.max_output_size = max_output_size
+        self.limits = limits
+        self.admission = admission
+        self.fork_server: Optional[ForkServer] = None
+        if hasattr(os, "fork") and hasattr(socket, "AF_UNIX") and hasattr(os, "pidfd_open"):
+            # The worker entry point lives here, so preload this module too
+            self.fork_server = ForkServer([__name__] + self.preload)
+            self._ctx = self.fork_server
+        else:
+            logger.warning(
+                "fork or pidfd unavailable, falling back to %s without preloading",
+                multiprocessing.get_start_method(),
+            )
+            self._ctx = multiprocessing.get_context()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self) -> None:
+        """Start the fork server and import the preloaded modules. Called lazily by run()."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if self.fork_server is not None:
+            self.fork_server.start()
+            atexit.register(self.shutdown)
+
+    def shutdown(self) -> None:
+        """Stop the fork server."""
+        if self.fork_server is not None:
+            self.fork_server.stop()
+
+    def execute(
+        self,
+        command: str,
+        timeout: Optional[float] = None,
+        limits: Optional[ResourceLimits] = None,
+        on_output: Optional[Callable[[str], None]] = None,
+    ) -> ExecutionResult:
+        """Run command in a freshly forked process and return its output and resource use.
+
+        Args:
+            command: The code to execute
+            timeout: Seconds to wait before the process is killed
+            limits: Resource limits for this execution, defaults to the instance's
+            on_output: Called with output pieces as they are produced
+
+        Returns:
+            ExecutionResult: The captured output, status and accounting
+        """
+        self.start()
+        spool = OutputSpool(self.max_output_size, on_output=on_output)
+        try:
+            with _admit(self.admission) as admitted:
+                if not admitted:
+                    return ExecutionResult(
+                        output=spool.finish("Execution rejected: too many running executions"),
+                        status="rejected",
+                    )
+                worker = _PoolWorker(self._ctx)
+                try:
+                    usage = worker.request(command, limits or self.limits, timeout, spool)
+                finally:
+                    worker.kill()
+                usage.pop("rss", None)
+                note = ""
+                if usage["status"] == "timeout":
+                    note = "Execution timed out"
+                elif usage["status"] == "crashed":
+                    note = "Execution failed: worker process exited"
+                return ExecutionResult(output=spool.finish(note), **usage)
+        finally:
+            spool.close()
+
+    def run(
+        self,
+        command: str,
+        timeout: Optional[float] = None,
+        on_output: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        """Run command in a freshly forked process and return anything printed.
+
+        Args:
+            command: The code to execute
+            timeout: Seconds to wait before the process is killed
+            on_output: Called with output pieces as they are produced
+
+        Returns:
+            str: The captured output, the exception repr, or a status message
+        """
+        return self.execute(command, timeout, on_output=on_output).output
+
+    def stream(self, command: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Run command in a freshly forked process, yielding output as it is produced."""
+        return _stream_from_thread(self.run, command, timeout)
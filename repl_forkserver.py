@@ -0,0 +1,254 @@
+"""Minimal fork server for ForkServerREPL.
+
+A small process that imports a list of modules once and then forks a
+child per request. Children start from that preloaded state and run the
+requested function directly. Unlike multiprocessing's forkserver, they
+never re-run the parent's __main__ module, so a server script's imports
+and setup don't run again for every execution.
+
+The server hands back a pidfd for each child along with its pid, so
+the client signals and waits on that process even after the server has
+reaped it and the pid has been reused. This needs Linux 5.3 or later.
+
+This module is the server's entry point and must stay free of side
+effects and heavy imports.
+"""
+import importlib
+import logging
+import os
+import pickle
+import select
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+from multiprocessing import Pipe, reduction
+from multiprocessing.connection import Connection
+from typing import Callable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct("!Q")
+_PID = struct.Struct("!q")
+_READY = b"R"
+
+
+def _send_message(sock: socket.socket, data: bytes) -> None:
+    sock.sendall(_LENGTH.pack(len(data)) + data)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError("fork server connection closed")
+        data += chunk
+    return data
+
+
+def _recv_message(sock: socket.socket) -> bytes:
+    (size,) = _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))
+    return _recv_exactly(sock, size)
+
+
+def _reap_children(signum, frame) -> None:
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if not pid:
+            return
+
+
+def _run_child(fd: int, target: Callable, args: tuple, conn_index: int) -> None:
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGCHLD})
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    args = list(args)
+    args[conn_index] = Connection(fd)
+    code = 0
+    try:
+        target(*args)
+    except BaseException:
+        import traceback
+
+        traceback.print_exc()
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def main(fd: int, preload: Sequence[str]) -> None:
+    """Serve fork requests on the socket fd until the client goes away."""
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"fork server could not preload {name}: {e}", file=sys.stderr)
+    # Children are reaped here, not by the kernel, so a child's pid stays
+    # taken until its pidfd is open; Ctrl+C is the client's to handle
+    signal.signal(signal.SIGCHLD, _reap_children)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    sock = socket.socket(fileno=fd)
+    sock.sendall(_READY)
+    while True:
+        try:
+            fds = reduction.recvfds(sock, 1)
+            target, args, conn_index = pickle.loads(_recv_message(sock))
+        except (EOFError, OSError):
+            break
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGCHLD})
+        try:
+            pid = os.fork()
+            if pid == 0:
+                sock.close()
+                _run_child(fds[0], target, args, conn_index)
+            pidfd = os.pidfd_open(pid)
+        finally:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGCHLD})
+        os.close(fds[0])
+        try:
+            reduction.sendfds(sock, [pidfd])
+            sock.sendall(_PID.pack(pid))
+        except OSError:
+            break
+        finally:
+            os.close(pidfd)
+
+
+class ForkedProcess:
+    """Handle on a child of the fork server, like a multiprocessing.Process.
+
+    Works through the child's pidfd, which becomes readable when the child
+    exits and never refers to another process, even once the pid is reused.
+    """
+
+    def __init__(self, server: "ForkServer", target: Callable, args: tuple) -> None:
+        self._server = server
+        self._target = target
+        self._args = args
+        self.pid: Optional[int] = None
+        self._pidfd: Optional[int] = None
+
+    def start(self) -> None:
+        self.pid, self._pidfd = self._server.fork(self._target, self._args)
+
+    def _exited(self, timeout: Optional[float]) -> bool:
+        poller = select.poll()
+        poller.register(self._pidfd, select.POLLIN)
+        return bool(poller.poll(None if timeout is None else timeout * 1000))
+
+    def is_alive(self) -> bool:
+        if self._pidfd is None:
+            return False
+        return not self._exited(0)
+
+    def kill(self) -> None:
+        if self._pidfd is None:
+            return
+        try:
+            signal.pidfd_send_signal(self._pidfd, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        if self._pidfd is not None and self._exited(timeout):
+            os.close(self._pidfd)
+            self._pidfd = None
+
+    def __del__(self) -> None:
+        if self._pidfd is not None:
+            os.close(self._pidfd)
+
+
+class ForkServer:
+    """Starts and talks to a fork server process.
+
+    Provides the Pipe() and Process() parts of a multiprocessing context,
+    so it can stand in for one when starting REPL workers. The target
+    must be a module-level function and args must contain exactly one
+    Connection, which the child receives as its end of the pipe.
+    """
+
+    def __init__(self, preload: Sequence[str] = ()) -> None:
+        """
+        Args:
+            preload: Modules the server imports once before forking children
+        """
+        self.preload: List[str] = list(preload)
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._process: Optional[subprocess.Popen] = None
+
+    @staticmethod
+    def Pipe():
+        return Pipe()
+
+    def Process(self, target: Callable, args: tuple = (), daemon: bool = True) -> ForkedProcess:
+        return ForkedProcess(self, target, args)
+
+    def start(self) -> None:
+        """Start the server and import the preloaded modules. Called lazily by fork()."""
+        with self._lock:
+            self._ensure_running()
+
+    def _ensure_running(self) -> None:
+        if self._process is not None and self._process.poll() is None:
+            return
+        if self._sock is not None:
+            self._sock.close()
+        self._sock, child = socket.socketpair()
+        # The server imports what this process can, without running its __main__
+        path = [p or os.getcwd() for p in sys.path]
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(path))
+        command = f"from repl_forkserver import main; main({child.fileno()}, {self.preload!r})"
+        try:
+            # Keep stray prints off this process's stdout, which may carry a protocol
+            self._process = subprocess.Popen(
+                [sys.executable, "-c", command],
+                pass_fds=(child.fileno(),),
+                env=env,
+                stdout=subprocess.DEVNULL,
+            )
+        finally:
+            child.close()
+        # Wait for the preload so the first fork is already cheap
+        _recv_exactly(self._sock, len(_READY))
+
+    def fork(self, target: Callable, args: tuple) -> Tuple[int, int]:
+        """Fork a child running target(*args) and return its pid and a pidfd for it."""
+        conn_index = next(i for i, arg in enumerate(args) if isinstance(arg, Connection))
+        fd = args[conn_index].fileno()
+        args = args[:conn_index] + (None,) + args[conn_index + 1 :]
+        payload = pickle.dumps((target, args, conn_index))
+        with self._lock:
+            for attempt in range(2):
+                self._ensure_running()
+                try:
+                    reduction.sendfds(self._sock, [fd])
+                    _send_message(self._sock, payload)
+                    (pidfd,) = reduction.recvfds(self._sock, 1)
+                    (pid,) = _PID.unpack(_recv_exactly(self._sock, _PID.size))
+                    return pid, pidfd
+                except (EOFError, OSError):
+                    if attempt:
+                        raise
+                    logger.warning("Fork server exited, restarting it")
+                    self._process.kill()
+                    self._process.wait()
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+            if self._process is not None:
+                try:
+                    self._process.wait(1.0)
+                except subprocess.TimeoutExpired:
+                    self._process.kill()
+                self._process = None
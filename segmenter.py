@@ -0,0 +1,111 @@
+import re
+
+# Tokens ending in a period that do not end a sentence
+ABBREVIATIONS = {
+    "mr.", "mrs.", "ms.", "dr.", "prof.", "sr.", "jr.", "st.", "vs.", "etc.",
+    "e.g.", "i.e.", "a.m.", "p.m.", "approx.", "no.", "fig.", "inc.", "ltd.",
+    "jan.", "feb.", "mar.", "apr.", "jun.", "jul.", "aug.", "sep.", "sept.",
+    "oct.", "nov.", "dec.",
+}
+
+FENCE = "```"
+
+# Sentence ends (with trailing quotes or brackets), clause ends and line breaks,
+# each only once the following whitespace has arrived
+_BOUNDARY = re.compile(r"(?P<sentence>[.!?]+[\"')\]]*)\s+|(?P<clause>[,;:])[ \t]+|\n+")
+_MARKUP = re.compile(r"[*_`]+|^\s*(?:#+|[-+>])\s+", re.MULTILINE)
+
+
+def _clean(segment: str) -> str:
+    """Strip markdown markup the TTS would otherwise read out."""
+    segment = _MARKUP.sub("", segment).strip()
+    return segment if re.search(r"\w", segment) else ""
+
+
+class SentenceSegmenter:
+    """Splits streamed text into speakable sentences and clauses.
+
+    Text is fed in as it arrives and complete sentences are returned as soon
+    as the whitespace after their final punctuation arrives. Long sentences
+    are also split at commas, semicolons and colons once they reach
+    min_clause_chars, so speech can start before a long sentence closes.
+    Abbreviations, initials, decimal numbers and list markers do not end a
+    sentence. Fenced code blocks are dropped.
+    """
+
+    def __init__(self, min_clause_chars: int = 40, skip_code: bool = True):
+        """
+        Args:
+            min_clause_chars: Minimum length before a clause is emitted on its own
+            skip_code: Drop fenced code blocks instead of emitting them
+        """
+        self.min_clause_chars = min_clause_chars
+        self.skip_code = skip_code
+        self._raw = ""
+        self._buffer = ""
+        self._in_code = False
+
+    def _is_sentence_end(self, segment: str) -> bool:
+        words = segment.split()
+        last = words[-1].lower().rstrip("\"')]") if words else ""
+        if not last.endswith("."):
+            return True
+        if last in ABBREVIATIONS or re.fullmatch(r"(?:[a-z]\.)+", last):
+            return False
+        # "1." starting a segment is a list marker, not a sentence
+        return not (len(words) == 1 and re.fullmatch(r"\d+\.", last))
+
+    def _split(self) -> list[str]:
+        segments = []
+        start = 0
+        for match in _BOUNDARY.finditer(self._buffer):
+            segment = self._buffer[start:match.end()]
+            if match.group("sentence") and not self._is_sentence_end(segment):
+                continue
+            if match.group("clause") and len(segment.strip()) < self.min_clause_chars:
+                continue
+            segments.append(segment)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return [s for s in map(_clean, segments) if s]
+
+    def _take_buffer(self) -> list[str]:
+        segment = _clean(self._buffer)
+        self._buffer = ""
+        return [segment] if segment else []
+
+    def feed(self, text: str) -> list[str]:
+        """Add streamed text and return the segments it completed."""
+        self._raw += text
+        segments = []
+        while self._raw:
+            index = self._raw.find(FENCE)
+            if index == -1:
+                # Hold back trailing backticks that may start a fence
+                keep = len(self._raw) - len(self._raw.rstrip("`"))
+                text, self._raw = self._raw[:len(self._raw) - keep], self._raw[len(self._raw) - keep:]
+                if self._in_code:
+                    if not self.skip_code:
+                        self._buffer += text
+                else:
+                    self._buffer += text
+                    segments += self._split()
+                break
+            text, self._raw = self._raw[:index], self._raw[index + len(FENCE):]
+            if self._in_code and not self.skip_code:
+                self._buffer += text
+                segments += self._take_buffer()
+            elif not self._in_code:
+                # A code block ends whatever sentence came before it
+                self._buffer += text
+                segments += self._split() + self._take_buffer()
+            self._in_code = not self._in_code
+        return segments
+
+    def flush(self) -> list[str]:
+        """Return the remaining text as a final segment and reset."""
+        if not self._in_code or not self.skip_code:
+            self._buffer += self._raw
+        self._raw = ""
+        self._in_code = False
+        return self._take_buffer()
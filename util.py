@@ -5,6 +5,7 @@ import numpy as np
 import numpy.typing as npt
 import sounddevice as sd
 
+from vad import VoiceActivityDetector
 
 
 
@@ -49,12 +50,23 @@ def _record_audio(screen: curses.window) -> npt.NDArray[np.float32]:
     return audio_data
 
 
-def record_audio():
+def record_audio(drop_silence: bool = True):
     # Using curses to record audio in a way that:
     # - doesn't require accessibility permissions on macos
     # - doesn't block the terminal
     audio_data = curses.wrapper(_record_audio)
-    return audio_data
+    if not drop_silence:
+        return audio_data
+
+    # Trim silence before, between and after speech so it isn't sent to STT
+    vad = VoiceActivityDetector(sample_rate=24000)
+    speech = np.concatenate([vad.process(audio_data), vad.flush()])
+    if not speech.size:
+        # Let STT decide rather than sending it nothing
+        print("[debug] VAD found no speech, sending the whole recording")
+        return audio_data
+    print(f"[debug] VAD dropped {vad.dropped_fraction:.0%} of the recording as silence")
+    return speech
 
 
 class AudioPlayer:
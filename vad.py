@@ -0,0 +1,130 @@
+import numpy as np
+
+
+class VoiceActivityDetector:
+    """Streaming voice activity detector that drops silence before STT.
+
+    Audio is split into frames, and all of a chunk's frames are classified
+    at once from their energy and zero-crossing rate. Frames above
+    threshold_db count as speech, except that quiet ones, below
+    zcr_below_db, must also have a zero-crossing rate below zcr_max:
+    low-level broadband noise crosses zero too often to pass, while loud
+    fricatives such as "s" and "f" are kept. A hangover keeps short pauses
+    inside an utterance from being dropped. Only speech is passed on,
+    together with pre_roll_ms of audio before each utterance and
+    post_roll_ms after it. Streaming speech-to-text models need some
+    trailing silence to detect the end of a turn, so post_roll_ms should
+    cover that.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 24000,
+        frame_ms: int = 20,
+        threshold_db: float = -45.0,
+        zcr_max: float = 0.35,
+        zcr_below_db: float = -30.0,
+        hangover_ms: int = 300,
+        pre_roll_ms: int = 200,
+        post_roll_ms: int = 800,
+    ):
+        """
+        Args:
+            sample_rate: Sample rate of the audio
+            frame_ms: Length of the frames audio is classified in
+            threshold_db: Frame level in dBFS above which a frame may be speech
+            zcr_max: Fraction of samples crossing zero above which a quiet frame is noise
+            zcr_below_db: Frame level in dBFS below which zcr_max applies
+            hangover_ms: Pause within speech that still counts as speech
+            pre_roll_ms: Audio passed before each utterance
+            post_roll_ms: Audio passed after each utterance, on top of the hangover
+        """
+        self.frame_size = sample_rate * frame_ms // 1000
+        self.threshold_db = threshold_db
+        self.zcr_max = zcr_max
+        self.zcr_below_db = zcr_below_db
+        self.hangover_frames = hangover_ms // frame_ms
+        self.pre_roll_frames = pre_roll_ms // frame_ms
+        self.post_roll_frames = post_roll_ms // frame_ms
+        self.reset()
+
+    def reset(self):
+        self._remainder = np.empty(0, dtype=np.int16)
+        # Recent frames that were not passed, kept for the pre-roll
+        self._history = np.empty((0, self.frame_size), dtype=np.int16)
+        # Frames since the last speech frame
+        self._since_speech = np.inf
+        self.is_speech = False
+        self.samples_in = 0
+        self.samples_passed = 0
+
+    @property
+    def dropped_fraction(self) -> float:
+        """Fraction of the audio seen so far that was dropped as silence."""
+        if not self.samples_in:
+            return 0.0
+        return 1 - self.samples_passed / self.samples_in
+
+    def _classify(self, frames: np.ndarray, scale: float) -> np.ndarray:
+        """Return which frames are speech, before hangover."""
+        samples = frames / scale
+        energy = np.mean(np.square(samples), axis=1)
+        level_db = 10 * np.log10(energy + 1e-12)
+        crossings = np.mean(np.signbit(samples[:, 1:]) != np.signbit(samples[:, :-1]), axis=1)
+        not_noise = (crossings <= self.zcr_max) | (level_db >= self.zcr_below_db)
+        return (level_db >= self.threshold_db) & not_noise
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Feed audio and return the part of it, and earlier audio, that should be passed on.
+
+        Accepts int16 or float audio of any shape and returns a 1-D array of
+        the same dtype, possibly empty.
+        """
+        dtype = samples.dtype
+        samples = samples.reshape(-1)
+        self.samples_in += len(samples)
+        if len(self._remainder):
+            samples = np.concatenate([self._remainder.astype(dtype, copy=False), samples])
+        count = len(samples) // self.frame_size
+        self._remainder = samples[count * self.frame_size:]
+        if not count:
+            return np.empty(0, dtype=dtype)
+        frames = samples[:count * self.frame_size].reshape(count, self.frame_size)
+        scale = 32768.0 if np.issubdtype(dtype, np.integer) else 1.0
+
+        # Frames since the last speech frame, carried over from the previous chunk
+        index = np.arange(count)
+        speech = self._classify(frames, scale)
+        last_speech = np.maximum.accumulate(np.where(speech, index, -np.inf))
+        since = np.minimum(index - last_speech, self._since_speech + index + 1)
+        self._since_speech = since[-1]
+        self.is_speech = bool(since[-1] <= self.hangover_frames)
+        passed = since <= self.hangover_frames + self.post_roll_frames
+
+        # Extend each passed run backwards by the pre-roll, into the history if needed
+        if len(self._history):
+            combined = np.concatenate([self._history.astype(dtype, copy=False), frames])
+        else:
+            combined = frames
+        offset = len(combined) - count
+        passed = np.concatenate([np.zeros(offset, dtype=bool), passed])
+        position = np.arange(len(combined))
+        next_passed = np.minimum.accumulate(np.where(passed, position, np.inf)[::-1])[::-1]
+        keep = next_passed - position <= self.pre_roll_frames
+
+        not_kept = np.flatnonzero(~keep)
+        tail = not_kept[not_kept > (np.flatnonzero(keep)[-1] if keep.any() else -1)]
+        self._history = combined[tail[-self.pre_roll_frames:]] if self.pre_roll_frames else combined[:0]
+
+        out = combined[keep].reshape(-1)
+        self.samples_passed += len(out)
+        return out.astype(dtype, copy=False)
+
+    def flush(self) -> np.ndarray:
+        """Return the buffered partial frame if speech is ongoing, and forget it."""
+        remainder, self._remainder = self._remainder, self._remainder[:0]
+        dtype = remainder.dtype
+        if self._since_speech <= self.hangover_frames + self.post_roll_frames:
+            self.samples_passed += len(remainder)
+            return remainder
+        return np.empty(0, dtype=dtype)